@@ -1,14 +1,16 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from backend import get_dashboard_stats, get_recent_forms, trigger_analysis, start_one_time_analysis, get_report_details, get_analysis_status, clear_analysis_status_message
-import base64
-import time
-import streamlit.components.v1 as components
+from services import get_dashboard_stats, get_data_version, get_recent_forms, get_rule_table, get_pdf_page_count, render_pdf_page, list_reports, trigger_analysis, start_one_time_analysis, get_report_details, get_analysis_status, clear_analysis_status_message, cancel_analysis, get_events, get_event_cursor, warm_up, DASHBOARD_NLP_WARM_UP, FORMS_DIR, SCHEDULE_MAX_CONCURRENCY, start_schedules, create_schedule, set_schedule_enabled, delete_schedule
+import os
 from streamlit_cookies_manager import CookieManager
 
 st.set_page_config(layout="wide")
 
+REPORTS_PAGE_SIZE = 20
+# How often the page checks (in memory) for backend events.
+EVENT_CHECK_SECONDS = 2
+
 # Initialize cookie manager
 cookies = CookieManager()
 
@@ -55,11 +57,82 @@ def login_page():
                 cookies['email'] = email
                 st.rerun()
 
+@st.cache_data(max_entries=4)
+def load_dashboard_frames(data_version):
+    """Reports and their missing rules as flat tables.
+
+    `data_version` only serves as the cache key: the frames are rebuilt once
+    per change to the stored reports, not on every rerun.
+    """
+    findings = ["missing_rule_ids", "missing_risk_levels"]
+    reports = pd.DataFrame(get_recent_forms(), columns=["report_id", "analysis_date", "compliance_score"] + findings)
+    reports["analysis_date"] = pd.to_datetime(reports["analysis_date"], format="ISO8601")
+    # One row per (report, missing rule); the sections come from the rule table.
+    exploded = reports[["report_id"] + findings].explode(findings).dropna(subset=["missing_rule_ids"])
+    sections = {rule_id: rule.get("section") for rule_id, rule in get_rule_table().items()}
+    missing_rules = pd.DataFrame({
+        "report_id": exploded["report_id"].to_numpy(),
+        "section": exploded["missing_rule_ids"].map(sections).to_numpy(),
+        "risk_level": exploded["missing_risk_levels"].to_numpy(),
+    })
+    return reports.drop(columns=findings), missing_rules
+
+
+@st.cache_data(max_entries=4)
+def build_dashboard_figures(data_version, manual_count, auto_count):
+    reports, missing_rules = load_dashboard_frames(data_version)
+
+    analysis_df = pd.DataFrame({"Type": ["Manual", "Automatic"], "Count": [manual_count, auto_count]})
+    analysis_fig = px.pie(analysis_df, names='Type', values='Count', title='Manual vs. Automatic Analyses')
+
+    severity_df = (
+        missing_rules["risk_level"].value_counts()
+        .reindex(["High", "Medium", "Low"], fill_value=0)
+        .rename_axis("Severity").reset_index(name="Count")
+    )
+    severity_fig = px.bar(severity_df, x='Severity', y='Count', color='Severity', title='Alerts by Risk Level')
+
+    trend_fig = px.line(reports.sort_values('analysis_date'), x='analysis_date', y='compliance_score', title='Compliance Score Trend', markers=True)
+    trend_fig.update_layout(xaxis_title="Analysis Date", yaxis_title="Compliance Score (%)")
+
+    section_df = (
+        missing_rules["section"].fillna("Uncategorized").value_counts(ascending=True)
+        .rename_axis("Section").reset_index(name="Count")
+    )
+    section_fig = px.bar(section_df, x='Count', y='Section', title='Most Frequent Alert Sections', orientation='h')
+
+    return {"analysis_types": analysis_fig, "severities": severity_fig, "score_trend": trend_fig, "sections": section_fig}
+
+
+@st.fragment
 def show_pdf(file_path):
-    with open(file_path, "rb") as f:
-        base64_pdf = base64.b64encode(f.read()).decode('utf-8')
-    pdf_display = f'<iframe src="data:application/pdf;base64,{base64_pdf}" width="100%" height="600" type="application/pdf"></iframe>'
-    st.markdown(pdf_display, unsafe_allow_html=True)
+    # Only the page being looked at is rendered (and cached) server-side and
+    # sent as an image; paging reruns just this fragment.
+    if not os.path.exists(file_path):
+        st.warning(f"{os.path.basename(file_path)} not found.")
+        return
+    page_count = get_pdf_page_count(file_path)
+    page = 1
+    if page_count > 1:
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, key=f"pdf_page_{file_path}")
+    st.image(render_pdf_page(file_path, page - 1), caption=f"Page {page} of {page_count}", use_container_width=True)
+
+
+@st.fragment(run_every=EVENT_CHECK_SECONDS)
+def watch_for_changes():
+    # Reruns on its own, without touching the rest of the page; only an actual
+    # event (a job changing state, new reports, a status message) re-renders it.
+    # Events of the jobs this session ran to completion itself are already on
+    # the page. Reports stored by other processes (the API, batch.py) publish
+    # no event here, so the store's data version is checked as well.
+    batch = get_events(st.session_state.event_cursor)
+    st.session_state.event_cursor = batch["cursor"]
+    news = [
+        event for event in batch["events"]
+        if not (event["type"] == "job" and event["job_id"] in st.session_state.settled_jobs)
+    ]
+    if news or batch["missed"] or get_data_version() != st.session_state.data_version:
+        st.rerun()
 
 
 def main_page():
@@ -108,8 +181,11 @@ def main_page():
         </style>
         """, unsafe_allow_html=True)
 
-    # Auto-refreshing component
-    components.html("<meta http-equiv='refresh' content='5'>", height=0)
+    # Everything up to now is reflected by this run; re-render on anything newer.
+    st.session_state.event_cursor = get_event_cursor()
+    st.session_state.data_version = get_data_version()
+    st.session_state.setdefault("settled_jobs", set())
+    watch_for_changes()
 
     # Status message bar
     status = get_analysis_status()
@@ -131,35 +207,22 @@ def main_page():
         col2.metric("Average Compliance Score", f'{stats["average_compliance_score"]:.2f}%')
         col3.metric("Total Alerts Raised", stats["total_alerts_raised"])
         st.divider()
-        reports = get_recent_forms()
-        if reports:
-            df = pd.DataFrame(reports)
-            
+        if stats["total_forms_analyzed"]:
+            figures = build_dashboard_figures(
+                get_data_version(),
+                stats.get("manual_analyses_count", 0),
+                stats.get("auto_analyses_count", 0),
+            )
+
             col1, col2 = st.columns(2)
 
             with col1:
                 st.subheader("Analysis Type Distribution")
-                analysis_counts = {
-                    "Manual": stats.get("manual_analyses_count", 0),
-                    "Automatic": stats.get("auto_analyses_count", 0)
-                }
-                analysis_df = pd.DataFrame(analysis_counts.items(), columns=["Type", "Count"])
-                fig = px.pie(analysis_df, names='Type', values='Count', title='Manual vs. Automatic Analyses')
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(figures["analysis_types"], use_container_width=True)
 
             with col2:
                 st.subheader("Risk Severity Distribution")
-                alert_counts = {"High": 0, "Medium": 0, "Low": 0}
-                for rules in df["missing_rules"]:
-                    if isinstance(rules, list):
-                        for alert in rules:
-                            severity = alert.get("risk_level", "Unknown")
-                            if severity in alert_counts:
-                                alert_counts[severity] += 1
-                
-                alert_df = pd.DataFrame(list(alert_counts.items()), columns=["Severity", "Count"])
-                fig = px.bar(alert_df, x='Severity', y='Count', color='Severity', title='Alerts by Risk Level')
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(figures["severities"], use_container_width=True)
 
             st.divider()
 
@@ -167,34 +230,45 @@ def main_page():
 
             with col3:
                 st.subheader("Compliance Score Over Time")
-                df['analysis_date'] = pd.to_datetime(df['analysis_date'])
-                df_sorted = df.sort_values('analysis_date')
-                fig = px.line(df_sorted, x='analysis_date', y='compliance_score', title='Compliance Score Trend', markers=True)
-                fig.update_layout(xaxis_title="Analysis Date", yaxis_title="Compliance Score (%)")
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(figures["score_trend"], use_container_width=True)
 
             with col4:
                 st.subheader("Alerts by Regulatory Section")
-                section_counts = {}
-                for rules in df["missing_rules"]:
-                    if isinstance(rules, list):
-                        for alert in rules:
-                            section = alert.get("section", "Uncategorized")
-                            section_counts[section] = section_counts.get(section, 0) + 1
-                
-                section_df = pd.DataFrame(list(section_counts.items()), columns=["Section", "Count"])
-                section_df = section_df.sort_values("Count", ascending=True)
-                fig = px.bar(section_df, x='Count', y='Section', title='Most Frequent Alert Sections', orientation='h')
-                st.plotly_chart(fig, use_container_width=True)
+                st.plotly_chart(figures["sections"], use_container_width=True)
 
             st.divider()
 
             st.subheader("Analysis Reports")
             manual_data_tab, automatic_data_tab = st.tabs(["Manual Analysis Data", "Automatic Analysis Data"])
 
-            def render_report_list(report_df, report_type):
-                if not report_df.empty:
-                    for index, row in report_df.iterrows():
+            def render_report_filters(report_type):
+                col_f1, col_f2, col_f3 = st.columns(3)
+                with col_f1:
+                    filename = st.text_input("Filename contains", key=f"{report_type}_filter_filename")
+                with col_f2:
+                    date_range = st.date_input("Analysis date range", value=(), key=f"{report_type}_filter_dates")
+                with col_f3:
+                    min_risk = st.selectbox("Minimum risk level", ["Any", "Low", "Medium", "High"], key=f"{report_type}_filter_risk")
+                return {
+                    "filename": filename or None,
+                    "date_from": date_range[0] if len(date_range) > 0 else None,
+                    "date_to": date_range[1] if len(date_range) > 1 else None,
+                    "min_risk_level": None if min_risk == "Any" else min_risk,
+                }
+
+            def render_report_list(report_type):
+                filters = render_report_filters(report_type)
+                # Cursors of the pages visited so far; reset when the filters change.
+                cursors_key = f"{report_type}_cursors"
+                filters_key = f"{report_type}_filters"
+                if st.session_state.get(filters_key) != filters or cursors_key not in st.session_state:
+                    st.session_state[filters_key] = filters
+                    st.session_state[cursors_key] = [None]
+                cursors = st.session_state[cursors_key]
+
+                page = list_reports(limit=REPORTS_PAGE_SIZE, cursor=cursors[-1], analysis_type=report_type, **filters)
+                if page["items"]:
+                    for row in page["items"]:
                         with st.container():
                             col_a, col_b = st.columns([3, 1])
                             with col_a:
@@ -206,6 +280,18 @@ def main_page():
                 else:
                     st.info(f"No {report_type} analysis reports available.")
 
+                col_prev, col_page, col_next = st.columns([1, 2, 1])
+                with col_prev:
+                    if len(cursors) > 1 and st.button("Previous", key=f"{report_type}_prev_page"):
+                        cursors.pop()
+                        st.rerun()
+                with col_page:
+                    st.caption(f"Page {len(cursors)}")
+                with col_next:
+                    if page["next_cursor"] and st.button("Next", key=f"{report_type}_next_page"):
+                        cursors.append(page["next_cursor"])
+                        st.rerun()
+
             def render_report_details(key_prefix=""):
                 st.subheader("Report Details")
                 report = st.session_state.selected_report
@@ -223,26 +309,24 @@ def main_page():
                     st.rerun()
 
             with manual_data_tab:
-                manual_df = df[df["analysis_type"] == "manual"]
                 if "selected_report" in st.session_state and st.session_state.selected_report:
                     col_list, col_details = st.columns(2)
                     with col_list:
-                        render_report_list(manual_df, "manual")
+                        render_report_list("manual")
                     with col_details:
                         render_report_details(key_prefix="manual")
                 else:
-                    render_report_list(manual_df, "manual")
+                    render_report_list("manual")
 
             with automatic_data_tab:
-                automatic_df = df[df["analysis_type"] == "auto"]
                 if "selected_report" in st.session_state and st.session_state.selected_report:
                     col_list, col_details = st.columns(2)
                     with col_list:
-                        render_report_list(automatic_df, "auto")
+                        render_report_list("auto")
                     with col_details:
                         render_report_details(key_prefix="auto")
                 else:
-                    render_report_list(automatic_df, "auto")
+                    render_report_list("auto")
 
     elif page == "Analyze Files":
         st.title("Analyze PDF Forms")
@@ -262,11 +346,21 @@ def main_page():
                 
                 st.subheader("Analysis Progress")
                 progress_bar = st.progress(0)
-                for i in range(100):
-                    time.sleep(0.05)
-                    progress_bar.progress(i + 1)
-                
-                results = trigger_analysis()
+
+                def show_progress(progress):
+                    total = progress.get("total") or 0
+                    text = f"Matched {progress['done']}/{total} forms ({progress.get('pages_extracted', 0)} pages extracted)"
+                    progress_bar.progress(progress["done"] / total if total else 0.0, text=text)
+
+                results = trigger_analysis(on_progress=show_progress)
+                st.session_state.settled_jobs.add(results.get("job_id"))
+                progress_bar.progress(1.0)
+                if results.get("error"):
+                    st.error(results["error"])
+                if results.get("unchanged"):
+                    st.info(f"{results['unchanged']} unchanged forms kept their latest report.")
+                for failure in results.get("errors", []):
+                    st.warning(f"Could not analyze {failure['filename']}: {failure['error']}")
                 
                 st.subheader("Analysis Results")
                 if results and results.get("analysis_results"):
@@ -287,10 +381,100 @@ def main_page():
             st.write("Schedule a one-time analysis to run after a specified delay.")
             delay = st.number_input("Delay in seconds", min_value=1, value=60)
             if st.button("Schedule Analysis"):
-                start_one_time_analysis(delay)
-                st.success(f"Analysis scheduled to run in {delay} seconds.")
+                result = start_one_time_analysis(delay)
+                if "error" in result:
+                    st.error(result["error"])
+                else:
+                    st.success(f"Analysis scheduled to run in {delay} seconds.")
+
+            status = get_analysis_status()
+            active_jobs = [job for job in status.get("jobs", []) if job["state"] in ("scheduled", "queued", "running")]
+            if active_jobs:
+                st.subheader("Pending Analyses")
+                for job in active_jobs:
+                    col_job, col_cancel = st.columns([3, 1])
+                    with col_job:
+                        progress = job["progress"]
+                        detail = f" ({progress['done']}/{progress['total']} forms)" if progress["total"] else ""
+                        when = f" at {job['run_at']}" if job["state"] == "scheduled" else ""
+                        st.text(f"{job['name'].capitalize()}: {job['state']}{when}{detail}")
+                    with col_cancel:
+                        if st.button("Cancel", key=f"cancel_{job['job_id']}"):
+                            cancel_analysis(job["job_id"])
+                            st.rerun()
+
+            st.subheader("Recurring Schedules")
+            with st.form("new_schedule"):
+                name = st.text_input("Name", value="Nightly analysis")
+                repeat = st.radio("Repeat", ["Every few minutes", "Cron expression"], horizontal=True)
+                col_interval, col_cron = st.columns(2)
+                with col_interval:
+                    interval_minutes = st.number_input("Minutes between runs", min_value=1, value=60)
+                with col_cron:
+                    cron = st.text_input("Cron expression", value="0 2 * * *", help="minute hour day month weekday; 0 2 * * * is every day at 2 AM")
+                forms_dir = st.text_input("Forms folder", value=FORMS_DIR)
+                col_rules_file, col_rules_dir = st.columns(2)
+                with col_rules_file:
+                    regulations_file = st.text_input("Regulations file", placeholder="default: data/regulations.json")
+                with col_rules_dir:
+                    regulations_dir = st.text_input("Regulation PDFs folder", placeholder="default: data/regulations")
+                col_catch_up, col_jitter, col_concurrency = st.columns(3)
+                with col_catch_up:
+                    catch_up = st.selectbox(
+                        "Missed runs", ["once", "skip", "all"],
+                        format_func={"once": "Run once", "skip": "Skip", "all": "Run each"}.get,
+                        help="What to do about runs that fell while the app was not running",
+                    )
+                with col_jitter:
+                    jitter = st.number_input("Jitter (seconds)", min_value=0, value=0, help="Random delay added to each run")
+                with col_concurrency:
+                    concurrency = st.number_input("Forms at a time", min_value=1, value=SCHEDULE_MAX_CONCURRENCY)
+                if st.form_submit_button("Add Schedule"):
+                    every = repeat == "Every few minutes"
+                    result = create_schedule(
+                        name,
+                        cron=None if every else cron,
+                        interval_seconds=interval_minutes * 60 if every else None,
+                        forms_dir=forms_dir or None,
+                        regulations_file=regulations_file or None,
+                        regulations_dir=regulations_dir or None,
+                        catch_up=catch_up,
+                        jitter_seconds=jitter,
+                        max_concurrency=concurrency,
+                    )
+                    if "error" in result:
+                        st.error(result["error"])
+                    else:
+                        st.success(result["message"])
+                        status = get_analysis_status()
+
+            for schedule in status.get("schedules", []):
+                col_schedule, col_toggle, col_delete = st.columns([3, 1, 1])
+                with col_schedule:
+                    every = schedule["cron"] or f"every {schedule['interval_seconds'] / 60:g} min"
+                    when = f"next run {schedule['next_run_at'][:16]}" if schedule["enabled"] else "paused"
+                    last = f", last {schedule['last_run_at'][:16]} ({schedule['last_outcome']})" if schedule["last_run_at"] else ""
+                    st.text(f"{schedule['name']} ({every}): {when}{last}")
+                with col_toggle:
+                    if st.button("Pause" if schedule["enabled"] else "Resume", key=f"toggle_{schedule['schedule_id']}"):
+                        set_schedule_enabled(schedule["schedule_id"], not schedule["enabled"])
+                        st.rerun()
+                with col_delete:
+                    if st.button("Delete", key=f"delete_{schedule['schedule_id']}"):
+                        delete_schedule(schedule["schedule_id"])
+                        st.rerun()
+
+    # What this run did itself (an immediate analysis, scheduling one) is on
+    # the page already; only later changes should re-render it.
+    st.session_state.event_cursor = get_event_cursor()
+    st.session_state.data_version = get_data_version()
 
 if st.session_state.logged_in:
     main_page()
 else:
     login_page()
+
+# Load the NLP model while the user looks at the page, once per server process.
+if DASHBOARD_NLP_WARM_UP:
+    warm_up()
+start_schedules()
@@ -1,12 +1,479 @@
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Dict, List, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+from python_multipart.multipart import MultipartParser, parse_options_header
+
 from services import (
+    FORMS_DIR,
+    MAX_UPLOAD_BYTES,
+    NLP_WARM_UP,
+    REGULATIONS_DIR,
+    REGULATIONS_FILE,
+    SCHEDULE_MAX_CONCURRENCY,
+    UPLOAD_DIR,
+    analyze_form,
     get_dashboard_stats,
+    get_data_version,
+    get_pdf_page_count,
     get_recent_forms,
+    get_regulation_set,
+    get_rule_table,
+    render_pdf_page,
+    get_scheduler,
+    get_store,
+    list_reports,
     trigger_analysis,
     get_report_details,
+    start_manual_analysis,
     start_one_time_analysis,
     get_analysis_status,
+    get_job_status,
+    cancel_analysis,
     clear_analysis_status_message,
+    get_cache_stats,
+    get_events,
+    get_event_cursor,
+    get_metrics,
+    get_metrics_text,
+    warm_up,
+    start_schedules,
+    get_schedule_runner,
+    create_schedule,
+    list_schedules,
+    set_schedule_enabled,
+    delete_schedule,
 )
 
-# This file is now a bridge between the main app and the services.
-# You can add any additional backend-specific logic here if needed.
\ No newline at end of file
+# This file is the bridge between the frontends and the services: the
+# Streamlit app imports the functions above directly, other clients use the
+# HTTP API below (`uvicorn backend:app`), so they all share one warm process.
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    # File I/O, PyMuPDF and spaCy work runs on the default executor, never on the event loop.
+    return await asyncio.get_running_loop().run_in_executor(None, partial(fn, *args, **kwargs))
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    if NLP_WARM_UP:
+        warm_up()
+    await _run_blocking(get_regulation_set)  # load the rules before the first request
+    start_schedules()
+    yield
+    get_schedule_runner().stop()
+    get_scheduler().shutdown()
+    get_store().close()
+
+
+app = FastAPI(title="EXLComply360", lifespan=_lifespan)
+
+
+# --- Conditional Responses ---
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _conditional_json(request: Request, payload: Any) -> Response:
+    """A JSON response with an ETag; 304 Not Modified when the client already has it."""
+    body = json.dumps(payload, default=str).encode("utf-8")
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# --- Uploads ---
+
+class _PdfUpload:
+    """python-multipart callbacks that stream every file part of a form into UPLOAD_DIR.
+
+    Parts are written to a temporary file and renamed into place once
+    complete and validated, so readers never see a partial upload. The
+    callbacks do blocking file I/O: feed the parser off the event loop.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.files: List[Dict[str, Any]] = []
+        self._headers: Dict[bytes, bytes] = {}
+        self._field = b""
+        self._value = b""
+        self._part: Optional[Dict[str, Any]] = None
+
+    def callbacks(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+        self._field = self._value = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._field.lower()] = self._value
+        self._field = self._value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"filename" not in options:
+            return  # a plain form field
+        filename = os.path.basename(options[b"filename"].decode("utf-8", "replace").replace("\\", "/"))
+        if not filename.lower().endswith(".pdf"):
+            raise HTTPException(415, f"{filename or 'File'} is not a PDF.")
+        stored_as = f"{uuid.uuid4()}_{filename}"
+        path = os.path.join(self.directory, stored_as)
+        self._part = {
+            "filename": filename,
+            "stored_as": stored_as,
+            "path": path,
+            "tmp_path": path + ".part",
+            "bytes": 0,
+            "head": b"",
+            "sha256": hashlib.sha256(),
+        }
+        self._part["file"] = open(self._part["tmp_path"], "wb")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part is None:
+            return
+        chunk = data[start:end]
+        part["bytes"] += len(chunk)
+        if part["bytes"] > self.max_bytes:
+            raise HTTPException(413, f"{part['filename']} is larger than {self.max_bytes} bytes.")
+        if len(part["head"]) < 5:
+            part["head"] += chunk[:5]
+        part["sha256"].update(chunk)
+        part["file"].write(chunk)
+
+    def _on_part_end(self):
+        part, self._part = self._part, None
+        if part is None:
+            return
+        part["file"].close()
+        if not part["head"].startswith(b"%PDF-"):
+            os.remove(part["tmp_path"])
+            raise HTTPException(415, f"{part['filename']} is not a PDF.")
+        os.replace(part["tmp_path"], part["path"])
+        self.files.append({
+            "filename": part["filename"],
+            "stored_as": part["stored_as"],
+            "path": part["path"],
+            "bytes": part["bytes"],
+            "sha256": part["sha256"].hexdigest(),
+        })
+
+    def abort(self):
+        """Remove everything written by a failed upload."""
+        part, self._part = self._part, None
+        if part is not None:
+            part["file"].close()
+            if os.path.exists(part["tmp_path"]):
+                os.remove(part["tmp_path"])
+        for saved in self.files:
+            if os.path.exists(saved["path"]):
+                os.remove(saved["path"])
+        self.files = []
+
+
+# --- PDF Viewer ---
+# PDFs are served by reference: whole files with HTTP range support (so a
+# browser viewer fetches only what it displays), or page by page as PNGs.
+
+_PDF_DIRS = {"forms": FORMS_DIR, "regulations": REGULATIONS_DIR, "uploads": UPLOAD_DIR}
+
+
+def _pdf_path(kind: str, name: str) -> str:
+    directory = _PDF_DIRS.get(kind)
+    if directory is None or name != os.path.basename(name) or not name.lower().endswith(".pdf"):
+        raise HTTPException(404, "PDF not found.")
+    path = os.path.join(directory, name)
+    if not os.path.isfile(path):
+        raise HTTPException(404, "PDF not found.")
+    return path
+
+
+# --- Events ---
+# Waiting clients poll the in-memory cursor from the event loop instead of
+# parking an executor thread each, so idle listeners cost next to nothing.
+
+_EVENT_POLL_SECONDS = 0.25
+_SSE_KEEPALIVE_SECONDS = 15
+
+
+async def _wait_for_events(cursor: int, timeout: float) -> Dict[str, Any]:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while get_event_cursor() == cursor and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(_EVENT_POLL_SECONDS)
+    return get_events(cursor)
+
+
+# --- HTTP API ---
+
+class AnalysisRequest(BaseModel):
+    type: Literal["manual", "auto"] = "manual"
+    delay: int = 0
+    force: bool = False  # re-analyze unchanged forms too
+    profile: bool = False  # add a cProfile/tracemalloc report to the job result
+
+
+class ScheduleRequest(BaseModel):
+    name: str
+    cron: Optional[str] = None  # e.g. "0 2 * * *"; or give interval_seconds
+    interval_seconds: Optional[float] = None
+    forms_dir: Optional[str] = None
+    regulations_file: Optional[str] = None
+    regulations_dir: Optional[str] = None
+    catch_up: Literal["skip", "once", "all"] = "once"
+    jitter_seconds: float = 0
+    max_concurrency: Optional[int] = None
+    force: bool = False
+
+
+class ScheduleUpdate(BaseModel):
+    enabled: bool
+
+
+@app.get("/stats")
+async def dashboard_stats(request: Request):
+    return _conditional_json(request, await _run_blocking(get_dashboard_stats))
+
+
+@app.get("/reports")
+async def reports(
+    request: Request,
+    limit: int = Query(20, ge=1, le=500),
+    cursor: Optional[str] = None,
+    analysis_type: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    filename: Optional[str] = None,
+    min_risk_level: Optional[str] = None,
+):
+    try:
+        page = await _run_blocking(
+            list_reports, limit, cursor, analysis_type, date_from, date_to, filename, min_risk_level
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    return _conditional_json(request, page)
+
+
+@app.get("/reports/{report_id}")
+async def report_details(request: Request, report_id: str):
+    report = await _run_blocking(get_report_details, report_id)
+    if report is None:
+        raise HTTPException(404, "Report not found.")
+    return _conditional_json(request, report)
+
+
+@app.post("/analyses", status_code=202)
+async def submit_analysis(analysis: AnalysisRequest, response: Response):
+    if analysis.type == "manual":
+        result = start_manual_analysis(analysis.force, analysis.profile)
+    else:
+        result = start_one_time_analysis(max(0, analysis.delay), analysis.force, analysis.profile)
+    if "error" in result:
+        raise HTTPException(503, result["error"])
+    response.headers["Location"] = f"/jobs/{result['job_id']}"
+    return result
+
+
+@app.get("/analyses/status")
+async def analysis_status(request: Request):
+    return _conditional_json(request, await _run_blocking(get_analysis_status))
+
+
+@app.get("/schedules")
+async def schedules(request: Request):
+    return _conditional_json(request, await _run_blocking(list_schedules))
+
+
+# The folders and files a schedule created through the API may read: the
+# app's own forms, uploads and regulations, and anything beneath them.
+_SCHEDULE_ROOTS = {
+    "forms_dir": (FORMS_DIR, UPLOAD_DIR),
+    "regulations_file": (REGULATIONS_FILE, REGULATIONS_DIR),
+    "regulations_dir": (REGULATIONS_DIR,),
+}
+
+
+def _check_schedule_paths(schedule: ScheduleRequest):
+    for field, roots in _SCHEDULE_ROOTS.items():
+        path = getattr(schedule, field)
+        if path is None:
+            continue
+        real = os.path.realpath(path)
+        if not any(os.path.commonpath([real, os.path.realpath(root)]) == os.path.realpath(root) for root in roots):
+            raise HTTPException(400, f"{field} is outside the app's folders ({', '.join(roots)}).")
+
+
+@app.post("/schedules", status_code=201)
+async def add_schedule(schedule: ScheduleRequest):
+    _check_schedule_paths(schedule)
+    result = await _run_blocking(create_schedule, **schedule.model_dump())
+    if "error" in result:
+        raise HTTPException(400, result["error"])
+    return result
+
+
+@app.patch("/schedules/{schedule_id}")
+async def update_schedule(schedule_id: str, update: ScheduleUpdate):
+    result = await _run_blocking(set_schedule_enabled, schedule_id, update.enabled)
+    if "error" in result:
+        raise HTTPException(404, result["error"])
+    return result
+
+
+@app.delete("/schedules/{schedule_id}")
+async def remove_schedule(schedule_id: str):
+    result = await _run_blocking(delete_schedule, schedule_id)
+    if "error" in result:
+        raise HTTPException(404, result["error"])
+    return result
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Pipeline metrics for Prometheus to scrape."""
+    return PlainTextResponse(get_metrics_text(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics.json")
+async def metrics_json():
+    return get_metrics()
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(request: Request, job_id: str):
+    status = get_job_status(job_id)
+    if status is None:
+        raise HTTPException(404, "Job not found.")
+    return _conditional_json(request, status)
+
+
+@app.get("/pdfs/{kind}/{name}")
+async def pdf_file(kind: str, name: str):
+    """The PDF itself; FileResponse answers Range requests with 206 Partial Content."""
+    return FileResponse(_pdf_path(kind, name), media_type="application/pdf", content_disposition_type="inline")
+
+
+@app.get("/pdfs/{kind}/{name}/info")
+async def pdf_info(kind: str, name: str):
+    return {"pages": await _run_blocking(get_pdf_page_count, _pdf_path(kind, name))}
+
+
+@app.get("/pdfs/{kind}/{name}/pages/{page}.png")
+async def pdf_page(request: Request, kind: str, name: str, page: int, width: int = Query(800, ge=100, le=2400)):
+    path = _pdf_path(kind, name)
+    try:
+        png = await _run_blocking(render_pdf_page, path, page - 1, width)
+    except IndexError:
+        raise HTTPException(404, "Page not found.")
+    etag = f'"{hashlib.sha256(png).hexdigest()[:32]}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=3600"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(png, media_type="image/png", headers=headers)
+
+
+@app.get("/events")
+async def events(cursor: int = Query(0, ge=0), timeout: float = Query(25, ge=0, le=60)):
+    """Long-poll for events newer than `cursor`; returns as soon as there is one."""
+    return await _wait_for_events(cursor, timeout)
+
+
+@app.get("/events/stream")
+async def event_stream(request: Request, cursor: Optional[int] = Query(None, ge=0)):
+    """The same events as Server-Sent Events; resumes from Last-Event-ID on reconnect."""
+    last_event_id = request.headers.get("last-event-id")
+    if cursor is None:
+        cursor = int(last_event_id) if last_event_id and last_event_id.isdigit() else get_event_cursor()
+
+    async def stream():
+        nonlocal cursor
+        while not await request.is_disconnected():
+            batch = await _wait_for_events(cursor, _SSE_KEEPALIVE_SECONDS)
+            if batch["missed"]:
+                yield f"id: {batch['cursor']}\nevent: reset\ndata: {{}}\n\n"
+            for event in batch["events"]:
+                yield f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if not batch["events"] and not batch["missed"]:
+                yield ": keep-alive\n\n"
+            cursor = batch["cursor"]
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    result = cancel_analysis(job_id)
+    if "error" in result:
+        raise HTTPException(404, result["error"])
+    return result
+
+
+@app.post("/uploads", status_code=201)
+async def upload_forms(request: Request, analyze: bool = False):
+    """Stream multipart PDF uploads into UPLOAD_DIR, optionally analyzing each one."""
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(415, "Expected a multipart/form-data upload.")
+    upload = _PdfUpload(UPLOAD_DIR, MAX_UPLOAD_BYTES)
+    parser = MultipartParser(options[b"boundary"], upload.callbacks())
+    try:
+        async for chunk in request.stream():
+            await _run_blocking(parser.write, chunk)
+        await _run_blocking(parser.finalize)
+    except HTTPException:
+        await _run_blocking(upload.abort)
+        raise
+    except Exception as e:
+        await _run_blocking(upload.abort)
+        raise HTTPException(400, f"Malformed upload: {e}")
+    if not upload.files:
+        raise HTTPException(400, "No PDF files in the upload.")
+
+    files = []
+    for saved in upload.files:
+        entry = {key: saved[key] for key in ("filename", "stored_as", "bytes", "sha256")}
+        try:
+            entry["pages"] = await _run_blocking(get_pdf_page_count, saved["path"])
+        except Exception as e:
+            await _run_blocking(os.remove, saved["path"])
+            entry["error"] = f"Could not open PDF: {e}"
+            files.append(entry)
+            continue
+        if analyze:
+            entry["report"] = await _run_blocking(analyze_form, saved["path"])
+        files.append(entry)
+    return {"files": files}
@@ -0,0 +1,201 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import metrics
+import services
+
+# --- Batch Analysis ---
+# Analyzes a whole portfolio of forms (any directory, thousands of PDFs) on a
+# process pool. Results are written to the store in chunks as they complete,
+# and every stored chunk is recorded in a checkpoint file, so an interrupted
+# run picks up where it stopped instead of starting over. Only forms that
+# were stored are checkpointed: the ones still in flight when a run dies, and
+# the ones that failed, are analyzed again on resume.
+
+
+def list_forms(directory: str, recursive: bool = False) -> List[str]:
+    """PDFs under `directory`, in a stable order."""
+    if not recursive:
+        return sorted(
+            os.path.join(directory, name) for name in os.listdir(directory) if name.lower().endswith(".pdf")
+        )
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        paths.extend(os.path.join(root, name) for name in sorted(files) if name.lower().endswith(".pdf"))
+    return paths
+
+
+def default_checkpoint(directory: str) -> str:
+    name = hashlib.sha256(os.path.abspath(directory).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(services.BATCH_DIR, f"{name}.jsonl")
+
+
+def _read_checkpoint(checkpoint_file: str, header: Dict[str, Any]) -> Set[str]:
+    # The forms already stored by an earlier run of the same batch. A
+    # checkpoint from a different directory or regulation set is ignored.
+    done: Set[str] = set()
+    try:
+        with open(checkpoint_file, "r", encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f if line.strip()]
+    except (OSError, ValueError):
+        return done
+    if not lines or lines[0] != header:
+        return done
+    for line in lines[1:]:
+        done.update(line["done"])
+    return done
+
+
+def _init_worker():
+    # Once per worker process: mark it as an analysis worker, load the
+    # regulation set and compile the matcher, loading the spaCy model if
+    # either needs it.
+    services.init_analysis_worker()
+    services.analyze_compliance("", services.get_regulation_set()["rules"])
+
+
+def run_batch(
+    directory: str,
+    analysis_type: str = "manual",
+    workers: Optional[int] = None,
+    chunk_size: int = services.BATCH_CHUNK_SIZE,
+    checkpoint_file: Optional[str] = None,
+    recursive: bool = False,
+    restart: bool = False,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+) -> Dict[str, Any]:
+    """Analyze every PDF in `directory`, resuming an interrupted run of the same batch.
+
+    When forms fail, the checkpoint is kept, so running the batch again
+    retries just those. Returns counts and timings only; the reports
+    themselves go to the store.
+    """
+    started = time.perf_counter()
+    checkpoint_file = checkpoint_file or default_checkpoint(directory)
+    os.makedirs(os.path.dirname(checkpoint_file) or ".", exist_ok=True)
+    header = {
+        "directory": os.path.abspath(directory),
+        "analysis_type": analysis_type,
+        "regulation_version": services.get_regulation_set()["version"],
+    }
+    file_paths = list_forms(directory, recursive)
+    done = set() if restart else _read_checkpoint(checkpoint_file, header)
+    if not done:
+        with open(checkpoint_file, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header) + "\n")
+    pending = [path for path in file_paths if path not in done]
+    total = len(file_paths)
+    completed = total - len(pending)
+    if on_progress:
+        on_progress(completed, total)
+
+    summary = {
+        "total": total,
+        "resumed": completed,
+        "analyzed": 0,
+        "errors": [],
+        "pages": 0,
+    }
+    chunk: List[Dict[str, Any]] = []
+
+    def flush():
+        if not chunk:
+            return
+        analyzed = [r for r in chunk if "error" not in r]
+        services.save_results([r["report"] for r in analyzed], [r["alert"] for r in analyzed if r["alert"]])
+        with open(checkpoint_file, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"done": [r["file_path"] for r in analyzed]}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        summary["analyzed"] += len(analyzed)
+        summary["errors"].extend(
+            {"filename": os.path.relpath(r["file_path"], directory), "error": r["error"]} for r in chunk if "error" in r
+        )
+        summary["pages"] += sum(r["pages"] for r in chunk)
+        chunk.clear()
+
+    workers = workers or os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    paths = iter(pending)
+    in_flight: Set[Future] = set()
+    # Stage times of the workers (sent back with each result) and of storing the results.
+    with metrics.collect() as timings:
+        try:
+            while True:
+                # Keep a bounded number of forms in flight, so memory stays flat however big the batch is.
+                while len(in_flight) < workers * 4:
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    in_flight.add(executor.submit(services.analyze_form_file, path, analysis_type))
+                if not in_flight:
+                    break
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    result = future.result()
+                    metrics.merge(result["timings"])
+                    chunk.append(result)
+                    completed += 1
+                    if len(chunk) >= chunk_size:
+                        flush()
+                if on_progress:
+                    on_progress(completed, total)
+        finally:
+            # Whatever finished before an interruption is still stored and checkpointed.
+            executor.shutdown(wait=False, cancel_futures=True)
+            flush()
+
+    if not summary["errors"]:
+        os.remove(checkpoint_file)  # the batch is complete; a new run starts from scratch
+    seconds = time.perf_counter() - started
+    analyzed_now = total - summary["resumed"]
+    summary["seconds"] = seconds
+    summary["timings"] = timings.to_dict()
+    summary["forms_per_second"] = analyzed_now / seconds if seconds > 0 else 0.0
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze a directory of PDF forms on a process pool.")
+    parser.add_argument("directory")
+    parser.add_argument("--analysis-type", choices=["manual", "auto"], default="manual")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=services.BATCH_CHUNK_SIZE, help="results stored per write")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: under data/batch/)")
+    parser.add_argument("--recursive", action="store_true", help="include PDFs in subdirectories")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    args = parser.parse_args()
+
+    def show_progress(done: int, total: int):
+        print(f"\r{done}/{total} forms", end="", flush=True)
+
+    summary = run_batch(
+        args.directory,
+        analysis_type=args.analysis_type,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint_file=args.checkpoint,
+        recursive=args.recursive,
+        restart=args.restart,
+        on_progress=show_progress,
+    )
+    print()
+    for error in summary["errors"]:
+        print(f"{error['filename']}: {error['error']}")
+    for name, stage in sorted(summary["timings"]["stages"].items(), key=lambda item: -item[1]["seconds"]):
+        print(f"{name:>12}: {stage['seconds']:.2f}s in {stage['calls']} calls (summed over workers)")
+    print(
+        f"Analyzed {summary['analyzed']} forms ({summary['resumed']} already done, "
+        f"{len(summary['errors'])} failed) in {summary['seconds']:.1f}s, "
+        f"{summary['forms_per_second']:.1f} forms/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
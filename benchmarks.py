@@ -0,0 +1,450 @@
+"""Offline micro-benchmarks for the analysis pipeline.
+
+Run with `python benchmarks.py <name>`; every benchmark generates its own
+synthetic input, and the micro-benchmarks check the optimized path against a
+reference one.
+"""
+import argparse
+import os
+import random
+import string
+import tempfile
+import time
+from typing import List, Dict, Any
+
+
+def _timed(fn, *args, repeat: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _random_words(rng: random.Random, count: int, vocabulary: int = 5000) -> List[str]:
+    vocab = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(vocabulary)]
+    return [rng.choice(vocab) for _ in range(count)]
+
+
+def _synthetic_rules(rng: random.Random, words: List[str], count: int) -> List[Dict[str, Any]]:
+    rules = []
+    for i in range(count):
+        keywords = []
+        for _ in range(rng.randint(1, 5)):
+            size = rng.randint(1, 3)
+            start = rng.randrange(len(words) - size)
+            keywords.append(" ".join(words[start:start + size]).title())
+        rules.append({"section": f"SECTION{i % 50}", "keywords": keywords, "requirement": f"Rule {i}"})
+    return rules
+
+
+def _naive_match(form_text: str, regulations: List[Dict[str, Any]]):
+    # The original per-rule substring scan, kept as the reference implementation.
+    form_text_lower = form_text.lower()
+    matched_rules = []
+    missing_rules = []
+    for rule in regulations:
+        keywords = [kw.lower() for kw in rule.get("keywords", [])]
+        if any(keyword in form_text_lower for keyword in keywords):
+            matched_rules.append(rule)
+        else:
+            missing_rules.append(rule)
+    return matched_rules, missing_rules
+
+
+def bench_matcher(args):
+    from matcher import get_rule_matcher
+    from services import analyze_compliance
+
+    rng = random.Random(args.seed)
+    form_words = _random_words(rng, args.form_words)
+    form_text = " ".join(form_words)
+    # Half the keywords come from the form, half from an unrelated corpus.
+    corpus = form_words + _random_words(rng, args.form_words)
+    print(f"form: {args.form_words} words, {len(form_text)} chars")
+    print(f"{'rules':>8} {'scan':>10} {'naive (ms)':>12} {'compiled (ms)':>14} {'speedup':>8} {'matched':>8}")
+    for count in args.rules:
+        regulations = _synthetic_rules(rng, corpus, count)
+        analyze_compliance(form_text, regulations)  # build and cache the matcher once
+        naive_time, expected = _timed(_naive_match, form_text, regulations)
+        fast_time, result = _timed(analyze_compliance, form_text, regulations)
+        assert (result["matched_rules"], result["missing_rules"]) == expected
+        scan = "substring" if get_rule_matcher(regulations).substring_scan else "automaton"
+        print(
+            f"{count:>8} {scan:>10} {naive_time * 1000:>12.2f} {fast_time * 1000:>14.2f} "
+            f"{naive_time / fast_time:>7.1f}x {result['matched_rules_count']:>8}"
+        )
+
+
+def bench_index(args):
+    from matcher import LemmaIndex, get_rule_matcher
+
+    rng = random.Random(args.seed)
+    form_words = _random_words(rng, args.form_words)
+    form_text = " ".join(form_words)
+    other_words = _random_words(rng, args.form_words)
+    print(f"form: {args.form_words} words, {len(form_text)} chars; {args.form_share:.0%} of rules drawn from its words")
+    print(
+        f"{'rules':>8} {'build (ms)':>11} {'candidates':>11} {'matched':>8} "
+        f"{'index (ms)':>11} {'exact (ms)':>11} {'naive (ms)':>11}"
+    )
+    for count in args.rules:
+        # A large library where most rules are about things the form never mentions.
+        relevant = int(count * args.form_share)
+        regulations = _synthetic_rules(rng, form_words, relevant) + _synthetic_rules(rng, other_words, count - relevant)
+        rng.shuffle(regulations)
+        build_time, index = _timed(LemmaIndex, regulations, repeat=1)
+        positions = index.form_positions(form_text)
+        candidates = index.candidates(positions)
+        index_time, (matched, _) = _timed(index.match, form_text)
+        # Verification only ever narrows the candidate set.
+        rule_ids = {id(rule): i for i, rule in enumerate(regulations)}
+        assert all(rule_ids[id(rule)] in candidates for rule in matched if rule.get("keywords"))
+        matcher = get_rule_matcher(regulations)
+        exact_time, _ = _timed(matcher.match, form_text)
+        naive_time, _ = _timed(_naive_match, form_text, regulations, repeat=1)
+        print(
+            f"{count:>8} {build_time * 1000:>11.1f} {len(candidates):>11} {len(matched):>8} "
+            f"{index_time * 1000:>11.2f} {exact_time * 1000:>11.2f} {naive_time * 1000:>11.2f}"
+        )
+
+
+def bench_semantic(args):
+    import numpy as np
+    from semantic import HashingEmbedder, SemanticIndex
+
+    rng = random.Random(args.seed)
+    words = _random_words(rng, 5000)
+    embedder = HashingEmbedder()
+    print(f"{'rules':>7} {'sentences':>10} {'embed rules (ms)':>17} {'embed form (ms)':>16} {'score (ms)':>11} {'matched':>8}")
+    for rules in args.rules:
+        regulations = [{"requirement": " ".join(rng.sample(words, 12))} for _ in range(rules)]
+        embed_rules_time, index = _timed(SemanticIndex, regulations, embedder, repeat=1)
+        for sentences in args.sentences:
+            # Every tenth sentence paraphrases a rule (its words shuffled), the rest are unrelated.
+            form = []
+            for i in range(sentences):
+                if i % 10 == 0:
+                    sentence = regulations[rng.randrange(rules)]["requirement"].split()
+                    rng.shuffle(sentence)
+                else:
+                    sentence = rng.sample(words, 12)
+                form.append(" ".join(sentence) + ".")
+            embed_form_time, form_vectors = _timed(index.embed_form, " ".join(form), repeat=1)
+            score_time, scores = _timed(index.scores, form_vectors)
+            matched = int(np.count_nonzero(scores >= embedder.default_threshold))
+            print(
+                f"{rules:>7} {sentences:>10} {embed_rules_time * 1000:>17.1f} {embed_form_time * 1000:>16.1f} "
+                f"{score_time * 1000:>11.2f} {matched:>8}"
+            )
+
+
+_SECTION_NAMES = ["ELIGIBILITY", "DISCLOSURE", "PREMIUMS", "CLAIMS", "RENEWABILITY", "REPLACEMENT", "REPORTING"]
+
+
+def _synthetic_regulation(rng: random.Random, pages: int, sentences_per_page: int = 20) -> str:
+    words = _random_words(rng, 2000, vocabulary=800)
+    page_texts = []
+    for page in range(pages):
+        sentences = [f"Section {page + 1}. {rng.choice(_SECTION_NAMES)}"]
+        for _ in range(sentences_per_page):
+            subject = " ".join(rng.sample(words, 3))
+            verb = rng.choice(["shall", "must", "may"])
+            sentences.append(f"The insurer {verb} provide the {subject} to the commissioner within {rng.randint(5, 90)} days.")
+        page_texts.append(" ".join(sentences))
+    return " ".join(page_texts)
+
+
+def _reference_rules(doc) -> List[Dict[str, Any]]:
+    # The original extractor: Span.noun_chunks and a backwards token scan per sentence.
+    rules = []
+    for sent in doc.sents:
+        if "must" in sent.text.lower() or "shall" in sent.text.lower():
+            keywords = [chunk.text for chunk in sent.noun_chunks]
+            section = "General"
+            for token in reversed(list(sent.doc[:sent.start])):
+                if token.is_alpha and token.text.isupper():
+                    section = token.text
+                    break
+            if keywords:
+                rules.append({"section": section, "keywords": keywords, "requirement": sent.text.strip()})
+    return rules
+
+
+def bench_sections(args):
+    import services
+
+    nlp = services.get_nlp()
+    if nlp is None:
+        print(f"This benchmark needs the {services.NLP_MODEL} model.")
+        return
+    rng = random.Random(args.seed)
+    print(f"{'pages':>6} {'tokens':>8} {'reference (ms)':>15} {'indexed (ms)':>13} {'indexed us/page':>16}")
+    for pages in args.pages:
+        text = _synthetic_regulation(rng, pages)
+        # One spaCy doc for the whole regulation, so the reference extractor
+        # shows its full quadratic cost.
+        nlp.max_length = max(nlp.max_length, len(text) + 1)
+        doc = nlp(text, disable=services._unused_components())
+        ref_time, expected = _timed(_reference_rules, doc, repeat=1)
+        fast_time, (rules, _) = _timed(services._rules_from_doc, doc, "General")
+        assert rules == expected
+        print(
+            f"{pages:>6} {len(doc):>8} {ref_time * 1000:>15.1f} {fast_time * 1000:>13.1f} "
+            f"{fast_time / pages * 1e6:>16.1f}"
+        )
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))] if ordered else 0.0
+
+
+def _generate_forms(directory: str, count: int, keywords: List[str], rng: random.Random):
+    import fitz
+
+    os.makedirs(directory, exist_ok=True)
+    existing = sum(1 for name in os.listdir(directory) if name.endswith(".pdf"))
+    words = _random_words(rng, 4000, vocabulary=1500)
+    for i in range(existing, count):
+        doc = fitz.open()
+        for _ in range(rng.randint(1, 3)):
+            # Every form mentions some of the regulation keywords, so each one
+            # has both matched and missing rules.
+            text = " ".join(rng.sample(words, 250) + rng.sample(keywords, min(len(keywords), 8)))
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=9)
+        doc.save(os.path.join(directory, f"form_{i:05d}.pdf"))
+        doc.close()
+
+
+def _use_workdir(services, forms_dir: str, workdir: str, storage: str):
+    # Point the service at the generated corpus and throwaway storage.
+    services.FORMS_DIR = forms_dir
+    services.REPORTS_FILE = os.path.join(workdir, "reports.json")
+    services.ALERTS_FILE = os.path.join(workdir, "alerts.json")
+    services.STATS_FILE = os.path.join(workdir, "stats.json")
+    services.RULES_FILE = os.path.join(workdir, "rules.json")
+    services.MANIFEST_FILE = os.path.join(workdir, "manifest.json")
+    services.SQLITE_DB_FILE = os.path.join(workdir, "compliance.db")
+    services.CACHE_DIR = os.path.join(workdir, "cache")
+    services.STORAGE_BACKEND = storage
+    services._store = None
+    services._content_cache = None
+    services._result_cache = None
+    # A fresh scheduler, so worker processes fork with the new paths.
+    if services._scheduler is not None:
+        services._scheduler.shutdown()
+        services._scheduler = None
+
+
+def _run_manual(services, force: bool) -> Dict[str, Any]:
+    return services.trigger_analysis(force=force)
+
+
+def _run_scheduled(services, force: bool) -> Dict[str, Any]:
+    scheduler = services.get_scheduler()
+    started = services.start_one_time_analysis(0, force)
+    job = scheduler.get(started["job_id"])
+    scheduler.wait(job.job_id)
+    return job.result if job.state == "succeeded" else {"error": job.error or job.state}
+
+
+def bench_analysis(args):
+    import services
+
+    rng = random.Random(args.seed)
+    keywords = [kw for rule in services.get_regulation_set()["rules"] for kw in rule["keywords"]]
+    print(f"{'forms':>6} {'path':>10} {'run':>10} {'seconds':>9} {'forms/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for count in args.forms:
+        forms_dir = os.path.join(args.corpus_dir, f"forms-{count}")
+        _generate_forms(forms_dir, count, keywords, rng)
+        for path, run in (("manual", _run_manual), ("scheduled", _run_scheduled)):
+            with tempfile.TemporaryDirectory() as workdir:
+                _use_workdir(services, forms_dir, workdir, args.storage)
+                # Cold and warm runs re-analyze every form, the warm one from
+                # the result cache; the incremental run finds them all unchanged.
+                for phase, force in (("cold", True), ("warm", True), ("unchanged", False)):
+                    start = time.perf_counter()
+                    result = run(services, force)
+                    elapsed = time.perf_counter() - start
+                    if result.get("error"):
+                        raise SystemExit(f"{path} analysis failed: {result['error']}")
+                    latencies = result["form_seconds"]
+                    print(
+                        f"{count:>6} {path:>10} {phase:>10} {elapsed:>9.2f} {count / elapsed:>9.1f} "
+                        f"{_percentile(latencies, 50) * 1000:>9.1f} {_percentile(latencies, 95) * 1000:>9.1f}"
+                    )
+                services.get_store().close()
+                services.get_scheduler().shutdown()
+
+
+def _history(rng: random.Random, reports: int, rules: List[Dict[str, Any]], missing_share: float):
+    # Reports and alerts in the layout the analysis produces, missing rules embedded.
+    report_list, alert_list = [], []
+    for i in range(reports):
+        missing = rng.sample(rules, int(len(rules) * missing_share))
+        report = {
+            "report_id": f"report-{i}",
+            "filename": f"form_{i:05d}.pdf",
+            "analysis_date": f"2025-01-01T00:00:{i % 60:02d}.{i:06d}",
+            "analysis_type": "manual",
+            "total_rules": len(rules),
+            "matched_rules_count": len(rules) - len(missing),
+            "missing_rules_count": len(missing),
+            "compliance_score": 100.0 * (len(rules) - len(missing)) / len(rules),
+            "missing_rules": missing,
+        }
+        report_list.append(report)
+        alert_list.append({
+            "alert_id": f"alert-{i}",
+            "report_id": report["report_id"],
+            "filename": report["filename"],
+            "alert_date": report["analysis_date"],
+            "missing_rules": missing,
+        })
+    return report_list, alert_list
+
+
+def _traced_peak(fn) -> int:
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+def bench_storage(args):
+    import storage
+
+    rng = random.Random(args.seed)
+    words = _random_words(rng, 20000)
+    rules = _synthetic_rules(rng, words, args.rules)
+    for rule in rules:
+        rule["requirement"] = " ".join(rng.sample(words, 30)).capitalize() + "."
+        rule["risk_level"] = rng.choice(storage.RISK_LEVELS)
+    print(f"{'reports':>8} {'layout':>9} {'disk (KB)':>10} {'load RAM (KB)':>14} {'load (ms)':>10} {'get_report (ms)':>16}")
+    for count in args.reports:
+        reports, alerts = _history(rng, count, rules, args.missing_share)
+        for layout in ("embedded", "interned"):
+            with tempfile.TemporaryDirectory() as workdir:
+                paths = [os.path.join(workdir, name) for name in ("reports.json", "alerts.json", "stats.json", "rules.json")]
+                if layout == "embedded":
+                    # The layout before the rule table: full rules in every report and alert.
+                    storage.write_json_file(paths[0], reports)
+                    storage.write_json_file(paths[1], alerts)
+                    store = storage.JsonReportStore(*paths)
+                    load = store.all_reports
+                else:
+                    store = storage.JsonReportStore(*paths)
+                    store.append(reports, alerts)
+                    store.compact()
+                    # What the dashboard loads: the reports and the rule table.
+                    load = lambda: (store.all_reports(), store.rule_table())  # noqa: E731
+                disk = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+                peak = _traced_peak(load)
+                load_seconds, _ = _timed(load)
+                get_seconds, _ = _timed(store.get_report, reports[count // 2]["report_id"])
+                print(
+                    f"{count:>8} {layout:>9} {disk / 1024:>10.0f} {peak / 1024:>14.0f} "
+                    f"{load_seconds * 1000:>10.1f} {get_seconds * 1000:>16.1f}"
+                )
+
+
+_STARTUP_SCRIPT = """
+import sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(elapsed, int("spacy" in sys.modules), int("fitz" in sys.modules))
+"""
+
+
+def bench_startup(args):
+    import statistics
+    import subprocess
+    import sys
+
+    # Every run is a fresh interpreter, so nothing is imported or loaded yet.
+    targets = [
+        ("import services", "import services"),
+        ("import backend", "import backend"),
+        ("load NLP model", "import services; services.warm_up(background=False)"),
+    ]
+    root = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'target':>16} {'median (ms)':>12} {'min (ms)':>9} {'spacy':>6} {'fitz':>5}")
+    for name, statement in targets:
+        times = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", _STARTUP_SCRIPT.format(statement=statement)],
+                cwd=root, capture_output=True, text=True, check=True,
+            ).stdout.split()[-3:]
+            times.append(float(output[0]))
+        spacy_loaded, fitz_loaded = ("yes" if flag == "1" else "no" for flag in output[1:])
+        print(
+            f"{name:>16} {statistics.median(times) * 1000:>12.0f} {min(times) * 1000:>9.0f} "
+            f"{spacy_loaded:>6} {fitz_loaded:>5}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    matcher = subparsers.add_parser("matcher", help="keyword matching vs. rule count")
+    matcher.add_argument("--rules", type=int, nargs="+", default=[5, 10, 100, 1000, 10000])
+    matcher.add_argument("--form-words", type=int, default=5000)
+    matcher.add_argument("--seed", type=int, default=0)
+    matcher.set_defaults(func=bench_matcher)
+
+    sections = subparsers.add_parser("sections", help="rule extraction vs. regulation length")
+    sections.add_argument("--pages", type=int, nargs="+", default=[25, 50, 100, 200])
+    sections.add_argument("--seed", type=int, default=0)
+    sections.set_defaults(func=bench_sections)
+
+    index = subparsers.add_parser("index", help="lemma index candidate selection vs. rule count")
+    index.add_argument("--rules", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    index.add_argument("--form-words", type=int, default=5000)
+    index.add_argument("--form-share", type=float, default=0.05, help="fraction of rules built from the form's words")
+    index.add_argument("--seed", type=int, default=0)
+    index.set_defaults(func=bench_index)
+
+    semantic = subparsers.add_parser("semantic", help="embedding index scoring vs. rules and form sentences")
+    semantic.add_argument("--rules", type=int, nargs="+", default=[100, 1000, 5000])
+    semantic.add_argument("--sentences", type=int, nargs="+", default=[100, 1000, 5000])
+    semantic.add_argument("--seed", type=int, default=0)
+    semantic.set_defaults(func=bench_semantic)
+
+    analysis = subparsers.add_parser("analysis", help="end-to-end form analysis throughput and latency")
+    analysis.add_argument("--forms", type=int, nargs="+", default=[10, 1000, 10000])
+    analysis.add_argument("--corpus-dir", default=os.path.join(tempfile.gettempdir(), "compliance-bench-forms"),
+                          help="where generated forms are kept (and reused) between runs")
+    analysis.add_argument("--storage", choices=["json", "sqlite"], default="json")
+    analysis.add_argument("--seed", type=int, default=0)
+    analysis.set_defaults(func=bench_analysis)
+
+    storage_parser = subparsers.add_parser("storage", help="report history size on disk and in memory, per layout")
+    storage_parser.add_argument("--reports", type=int, nargs="+", default=[100, 1000])
+    storage_parser.add_argument("--rules", type=int, default=100)
+    storage_parser.add_argument("--missing-share", type=float, default=0.5, help="fraction of rules each report misses")
+    storage_parser.add_argument("--seed", type=int, default=0)
+    storage_parser.set_defaults(func=bench_storage)
+
+    startup = subparsers.add_parser("startup", help="import time of the services and the backend")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+from storage import file_lock
+
+# --- Content Cache ---
+# A size-bounded, least-recently-used cache of derived data (extracted text,
+# extracted rules) stored as one file per entry. Keys are built by the caller
+# from a content hash plus the version of whatever produced the value, so
+# entries never need explicit invalidation; stale ones simply age out.
+# ResultCache keeps the most recently used JSON values in memory as well.
+
+TEXT_SUFFIX = ".txt"
+JSON_SUFFIX = ".json"
+BYTES_SUFFIX = ".bin"
+_READ_BLOCK = 1 << 16
+_STALE_TMP_SECONDS = 3600
+# The entries' total size, shared by the processes using the directory.
+_SIZE_FILE = ".size"
+# Eviction goes down to this fraction of the bound, so that a full cache is
+# not rescanned on every write.
+EVICT_TO = 0.9
+
+
+def file_digest(file_path: str) -> str:
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def make_key(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+class ContentCache:
+    """Entries are files in `directory`, which several processes may share.
+
+    An entry's mtime is its recency, refreshed on every hit. The total size
+    is kept in a size file that writers update under a file lock; the writer
+    that takes it over `max_bytes` rescans the directory and evicts the least
+    recently used entries. Lookups and evictions are counted with `metrics`,
+    so the counts of worker processes travel back with their results.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._size_path = self._path(_SIZE_FILE)
+        with file_lock(self._size_path):
+            self._write_size(self._scan()[1])
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _scan(self) -> Tuple[List[Tuple[float, str, int]], int]:
+        # The entries as (mtime, name, size), least recently used first, and their total size.
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("."):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # removed meanwhile
+            if entry.name.endswith(".tmp"):
+                # Left behind by an interrupted write (recent ones may still be in use).
+                if time.time() - stat.st_mtime > _STALE_TMP_SECONDS:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+                continue
+            entries.append((stat.st_mtime, entry.name, stat.st_size))
+        entries.sort()
+        return entries, sum(size for _, _, size in entries)
+
+    def _read_size(self) -> int:
+        try:
+            with open(self._size_path, "r", encoding="utf-8") as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return self._scan()[1]
+
+    def _write_size(self, total: int):
+        with open(self._size_path, "w", encoding="utf-8") as f:
+            f.write(str(total))
+
+    def _lookup(self, name: str) -> bool:
+        try:
+            os.utime(self._path(name))  # refresh its recency, for every process
+        except OSError:
+            metrics.count("content_cache_misses")
+            return False
+        metrics.count("content_cache_hits")
+        return True
+
+    def _commit(self, tmp_path: str, name: str):
+        size = os.path.getsize(tmp_path)
+        path = self._path(name)
+        with file_lock(self._size_path):
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+            total = self._read_size() + size - replaced
+            if total > self.max_bytes:
+                total = self._evict(keep=name)
+            self._write_size(total)
+
+    def _evict(self, keep: str) -> int:
+        # Called under the size file's lock; returns the new total size.
+        entries, total = self._scan()
+        evicted = 0
+        for _, name, size in entries:
+            if total <= self.max_bytes * EVICT_TO:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        metrics.count("content_cache_evictions", evicted)
+        return total
+
+    def _tmp_path(self) -> str:
+        return self._path(f"{uuid.uuid4().hex}.tmp")
+
+    def get_json(self, key: str) -> Optional[Any]:
+        name = key + JSON_SUFFIX
+        if not self._lookup(name):
+            return None
+        try:
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # evicted meanwhile
+
+    def put_json(self, key: str, value: Any):
+        tmp_path = self._tmp_path()
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(value, f)
+        self._commit(tmp_path, key + JSON_SUFFIX)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        name = key + BYTES_SUFFIX
+        if not self._lookup(name):
+            return None
+        try:
+            with open(self._path(name), "rb") as f:
+                return f.read()
+        except OSError:
+            return None  # evicted meanwhile
+
+    def put_bytes(self, key: str, value: bytes):
+        tmp_path = self._tmp_path()
+        with open(tmp_path, "wb") as f:
+            f.write(value)
+        self._commit(tmp_path, key + BYTES_SUFFIX)
+
+    def iter_text(self, key: str) -> Optional[Iterator[str]]:
+        """Return a block-wise reader over a cached text, or None on a miss."""
+        name = key + TEXT_SUFFIX
+        if not self._lookup(name):
+            return None
+        try:
+            f = open(self._path(name), "r", encoding="utf-8")
+        except OSError:
+            return None  # evicted meanwhile
+
+        def blocks():
+            with f:
+                yield from iter(lambda: f.read(_READ_BLOCK), "")
+
+        return blocks()
+
+    def store_text(self, key: str, chunks: Iterable[str]) -> Iterator[str]:
+        """Pass `chunks` through while writing them to the cache.
+
+        The entry is only committed once the stream has been fully consumed,
+        so an abandoned or failing stream never leaves a partial text behind.
+        """
+        tmp_path = self._tmp_path()
+        completed = False
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    yield chunk
+            completed = True
+            self._commit(tmp_path, key + TEXT_SUFFIX)
+        finally:
+            if not completed and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size on disk, shared by every process; lookups are counted in `metrics`."""
+        with file_lock(self._size_path):
+            total = self._read_size()
+        return {"bytes": total, "max_bytes": self.max_bytes}
+
+
+class ResultCache:
+    """An in-memory LRU of up to `max_entries` JSON values in front of a ContentCache.
+
+    Values found only on disk are promoted to memory. Callers must treat the
+    values as read-only: the memory tier hands out the stored objects. The
+    tier a lookup was served from is returned for callers to count.
+    """
+
+    def __init__(self, store: ContentCache, max_entries: int):
+        self.store = store
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+
+    def _remember(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """Return (value, tier it came from: "memory" or "disk"), or (None, None) on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key], "memory"
+        value = self.store.get_json(key)
+        if value is None:
+            return None, None
+        self._remember(key, value)
+        return value, "disk"
+
+    def put(self, key: str, value: Any):
+        self.store.put_json(key, value)
+        self._remember(key, value)
@@ -0,0 +1,54 @@
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+# --- Event Channel ---
+# An in-process, sequence-numbered log of things frontends care about (job
+# lifecycle, new reports, status messages). Clients remember the last
+# sequence number they have seen and ask for anything newer, either right
+# away or by long-polling, so an idle client costs nothing but a wait.
+
+
+class EventBus:
+    def __init__(self, history: int = 1000):
+        self._lock = threading.Condition()
+        self._events: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._seq = 0
+
+    @property
+    def cursor(self) -> int:
+        """Sequence number of the latest event (0 before the first one)."""
+        return self._seq
+
+    def publish(self, event_type: str, **data) -> int:
+        with self._lock:
+            self._seq += 1
+            self._events.append(dict(data, seq=self._seq, type=event_type, time=time.time()))
+            self._lock.notify_all()
+            return self._seq
+
+    def since(self, cursor: int, timeout: Optional[float] = 0) -> Dict[str, Any]:
+        """Events newer than `cursor`, waiting up to `timeout` seconds for one.
+
+        `timeout=None` waits indefinitely. "missed" is set when older events
+        have already been dropped from the history (or the cursor comes from
+        before a restart), in which case the client should reload everything
+        rather than apply the events.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            if cursor > self._seq:
+                return {"cursor": self._seq, "events": [], "missed": True}
+            while self._seq <= cursor:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+            events: List[Dict[str, Any]] = [event for event in self._events if event["seq"] > cursor]
+            oldest = self._events[0]["seq"] if self._events else self._seq + 1
+            return {
+                "cursor": self._seq,
+                "events": events,
+                "missed": cursor < self._seq and cursor + 1 < oldest,
+            }
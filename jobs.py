@@ -0,0 +1,355 @@
+import asyncio
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from datetime import datetime
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List, Optional
+
+# --- Job Scheduler ---
+# An in-process scheduler for analysis jobs: a bounded queue drained by a pool
+# of worker threads. Jobs fan their per-item work out to a shared executor, a
+# process pool for CPU-heavy work (PDF extraction, matching) or a thread pool
+# when the work is mostly I/O. Delayed jobs are timers on the process's
+# background event loop (see below), not a thread each. Background jobs
+# (scheduled runs) are kept off one worker, so interactive jobs always find one.
+
+SCHEDULED = "scheduled"
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATES = (SCHEDULED, QUEUED, RUNNING)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+# --- Background Event Loop ---
+# One asyncio loop per process, on a daemon thread, for everything that waits
+# on the clock: delayed jobs and recurring schedules. Callbacks running on it
+# must be quick; real work goes to the scheduler's workers.
+
+_background_loop: Optional[asyncio.AbstractEventLoop] = None
+_background_loop_lock = threading.Lock()
+
+
+def background_loop() -> asyncio.AbstractEventLoop:
+    """The process's background event loop, started on first use."""
+    global _background_loop
+    with _background_loop_lock:
+        if _background_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="background-loop", daemon=True).start()
+            _background_loop = loop
+        return _background_loop
+
+
+class Job:
+    """A unit of work; also the context object handed to the job function."""
+
+    def __init__(
+        self, scheduler: "JobScheduler", name: str, fn: Callable, args: tuple, kwargs: dict, background: bool = False
+    ):
+        self.job_id = str(uuid.uuid4())
+        self.name = name
+        self.background = background
+        self.state = QUEUED
+        self.progress: Dict[str, Any] = {"done": 0, "total": None, "message": None}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.run_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._scheduler = scheduler
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._cancel = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def check_cancelled(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def set_progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None, **details):
+        self.progress = dict(details, done=done, total=total, message=message)
+
+    def wait(self, seconds: float):
+        """Sleep, waking up early (with JobCancelled) if the job is cancelled."""
+        if self._cancel.wait(seconds):
+            raise JobCancelled()
+
+    def map(
+        self, fn: Callable, *iterables: Iterable[Any], inline: bool = False, limit: Optional[int] = None
+    ) -> Iterator[Any]:
+        """Run `fn` over `iterables` (like `map`) on the scheduler's executor, yielding results as they complete.
+
+        With `limit`, at most that many calls are on the executor at a time,
+        leaving the rest of it to other jobs. With `inline`, the calls run one
+        by one on the job's own thread instead (e.g. so that a profiler
+        attached to it sees them).
+        """
+        if inline:
+            for args in zip(*iterables):
+                self.check_cancelled()
+                yield fn(*args)
+            return
+        if limit is None:
+            futures: List[Future] = [self._scheduler.executor.submit(fn, *args) for args in zip(*iterables)]
+            try:
+                for future in as_completed(futures):
+                    self.check_cancelled()
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+            return
+        calls = zip(*iterables)
+        in_flight = set()
+        try:
+            while True:
+                for args in calls:
+                    in_flight.add(self._scheduler.executor.submit(fn, *args))
+                    if len(in_flight) >= limit:
+                        break
+                if not in_flight:
+                    return
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    self.check_cancelled()
+                    yield future.result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    def _run(self):
+        self.started_at = time.time()
+        try:
+            self.check_cancelled()
+            self.result = self._fn(self, *self._args, **self._kwargs)
+            self.state = SUCCEEDED
+        except JobCancelled:
+            self.state = CANCELLED
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.state = FAILED
+        finally:
+            self.finished_at = time.time()
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "background": self.background,
+            "state": self.state,
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created_at": _iso(self.created_at),
+            "run_at": _iso(self.run_at),
+            "started_at": _iso(self.started_at),
+            "finished_at": _iso(self.finished_at),
+            "queued_seconds": (self.started_at or end) - (self.run_at or self.created_at),
+            "run_seconds": end - self.started_at if self.started_at else None,
+        }
+
+
+class JobScheduler:
+    def __init__(
+        self,
+        workers: int = 2,
+        max_queue: int = 16,
+        executor: str = "process",
+        executor_workers: Optional[int] = None,
+        history: int = 100,
+        listener: Optional[Callable[[Job], None]] = None,
+        background_workers: Optional[int] = None,
+        process_initializer: Optional[Callable[[], None]] = None,
+    ):
+        if executor not in ("process", "thread"):
+            raise ValueError(f"Unknown executor kind: {executor}")
+        self.workers = workers
+        # Workers that background jobs (e.g. scheduled runs) may occupy at
+        # once; by default all but one, which stays free for interactive jobs.
+        self.background_workers = background_workers or max(1, workers - 1)
+        self.max_queue = max_queue
+        self.executor_kind = executor
+        self.executor_workers = executor_workers or os.cpu_count() or 1
+        self.process_initializer = process_initializer  # run once in each process-executor worker
+        self.history = history
+        self.listener = listener  # called with a job whenever its state changes
+        self._lock = threading.Condition()
+        self._pending: Deque[Job] = deque()
+        self._jobs: Dict[str, Job] = {}
+        self._running_background = 0
+        self._threads: List[threading.Thread] = []
+        self._executor: Optional[Executor] = None
+        self._shutdown = False
+
+    @property
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None:
+                if self.executor_kind == "process":
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.executor_workers, initializer=self.process_initializer
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.executor_workers)
+            return self._executor
+
+    def _start_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_job(self) -> Optional[Job]:
+        # The oldest pending job a worker may start; background jobs wait
+        # while `background_workers` of them are running.
+        for job in self._pending:
+            if not job.background or self._running_background < self.background_workers:
+                self._pending.remove(job)
+                return job
+        return None
+
+    def _worker(self):
+        while True:
+            with self._lock:
+                job = None
+                while not self._shutdown and job is None:
+                    job = self._next_job()
+                    if job is None:
+                        self._lock.wait()
+                if self._shutdown:
+                    return
+                job.state = RUNNING
+                self._running_background += job.background
+            self._notify(job)
+            job._run()
+            with self._lock:
+                self._running_background -= job.background
+                self._lock.notify_all()
+            self._notify(job)
+
+    def _notify(self, job: Job):
+        if self.listener is not None:
+            self.listener(job)
+
+    def _waiting(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.state in (SCHEDULED, QUEUED))
+
+    def submit(self, name: str, fn: Callable, *args, delay: float = 0, background: bool = False, **kwargs) -> Job:
+        """Queue `fn(job, *args, **kwargs)`, optionally after `delay` seconds.
+
+        `background` jobs never take the workers kept for interactive ones
+        (see `background_workers`). Raises QueueFull when `max_queue` jobs are
+        already waiting.
+        """
+        job = Job(self, name, fn, args, kwargs, background)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Scheduler is shut down")
+            if self._waiting() >= self.max_queue:
+                raise QueueFull(f"{self.max_queue} jobs are already waiting")
+            self._jobs[job.job_id] = job
+            self._prune()
+            self._start_workers()
+            if delay > 0:
+                job.state = SCHEDULED
+                job.run_at = job.created_at + delay
+                # A cancelled job's timer still fires, and `_enqueue` ignores it.
+                loop = background_loop()
+                loop.call_soon_threadsafe(loop.call_later, delay, self._enqueue, job)
+            else:
+                self._enqueue_locked(job)
+        self._notify(job)
+        return job
+
+    def _enqueue(self, job: Job):
+        with self._lock:
+            if job.state != SCHEDULED or self._shutdown:
+                return
+            self._enqueue_locked(job)
+        self._notify(job)
+
+    def _enqueue_locked(self, job: Job):
+        job.state = QUEUED
+        self._pending.append(job)
+        self._lock.notify_all()
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job; running jobs stop at their next cancellation check."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in ACTIVE_STATES:
+                return False
+            job._cancel.set()
+            if job.state == QUEUED:
+                self._pending.remove(job)
+            elif job.state == RUNNING:
+                return True
+            job.state = CANCELLED
+            job.finished_at = time.time()
+            self._lock.notify_all()
+        self._notify(job)
+        return True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        """Known jobs, most recently created first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def _prune(self):
+        finished = [job for job in self._jobs.values() if job.state not in ACTIVE_STATES]
+        for job in sorted(finished, key=lambda job: job.created_at)[:max(0, len(finished) - self.history)]:
+            del self._jobs[job.job_id]
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Job]:
+        """Block until the job has finished (or `timeout` elapses).
+
+        Returns None, like `get`, for unknown jobs, including finished ones
+        already pruned from the history.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            while job.state in ACTIVE_STATES:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._lock.wait(remaining)
+        return job
+
+    def shutdown(self):
+        with self._lock:
+            self._shutdown = True
+            for job in list(self._jobs.values()):
+                if job.state in ACTIVE_STATES:
+                    job._cancel.set()
+            self._lock.notify_all()
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
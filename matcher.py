@@ -0,0 +1,316 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict, deque
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Set, Tuple, Union
+
+# --- Keyword Matching ---
+# An Aho-Corasick automaton over every keyword of a regulation set. Matching is
+# plain (case-insensitive) substring containment, exactly like the original
+# `keyword in form_text_lower` check, but all keywords are found in a single
+# pass over the text no matter how many rules there are. The automaton is
+# walked in Python, though, so RuleMatcher keeps that original check (a
+# C-level substring search per keyword) for small regulation sets.
+
+# Up to this many distinct keywords, RuleMatcher searches for each rule's
+# keywords directly instead of building an automaton (see `benchmarks.py matcher`).
+SUBSTRING_SCAN_MAX_KEYWORDS = 500
+
+
+class KeywordMatcher:
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        for keyword in keywords:
+            self._add(keyword)
+        self._build()
+
+    def keyword_id(self, keyword: str) -> int:
+        return self._ids[keyword]
+
+    def _add(self, keyword: str) -> int:
+        if keyword in self._ids:
+            return self._ids[keyword]
+        keyword_id = len(self.keywords)
+        self.keywords.append(keyword)
+        self._ids[keyword] = keyword_id
+        state = 0
+        for ch in keyword:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + (keyword_id,)
+        return keyword_id
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def scan(self, chunks: Union[str, Iterable[str]]) -> Set[int]:
+        """Return the ids of all keywords occurring in the text.
+
+        `chunks` may be a single string or an iterable of strings that are
+        treated as one continuous text, so matches spanning chunk boundaries
+        are still found.
+        """
+        if isinstance(chunks, str):
+            chunks = (chunks,)
+        goto, fail, out = self._goto, self._fail, self._out
+        found: Set[int] = set(out[0])  # the empty keyword matches anything
+        wanted = len(self.keywords)
+        state = 0
+        for chunk in chunks:
+            if len(found) == wanted:
+                break
+            for ch in chunk:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                if out[state]:
+                    found.update(out[state])
+        return found
+
+
+class RuleMatcher:
+    """Compiled keyword matcher for one regulation set."""
+
+    def __init__(self, regulations: List[Dict[str, Any]], substring_scan_max: Optional[int] = None):
+        self.regulations = regulations
+        rule_keywords = [[kw.lower() for kw in rule.get("keywords", [])] for rule in regulations]
+        if substring_scan_max is None:
+            substring_scan_max = SUBSTRING_SCAN_MAX_KEYWORDS
+        self.substring_scan = len({kw for keywords in rule_keywords for kw in keywords}) <= substring_scan_max
+        if self.substring_scan:
+            self._rule_keywords = rule_keywords
+            self._overlap = max((len(kw) for keywords in rule_keywords for kw in keywords), default=1) - 1
+            return
+        self._keywords = KeywordMatcher(kw for keywords in rule_keywords for kw in keywords)
+        self._rule_keyword_ids = [
+            frozenset(self._keywords.keyword_id(kw) for kw in keywords) for keywords in rule_keywords
+        ]
+
+    def _satisfied_by_substrings(self, chunks: Iterable[str]) -> List[bool]:
+        # Each chunk is searched together with the end of the text before it,
+        # long enough to hold any keyword that spans the boundary; a rule is
+        # done with as soon as one of its keywords turns up.
+        satisfied = ["" in keywords for keywords in self._rule_keywords]  # like the automaton
+        remaining = [(index, keywords) for index, keywords in enumerate(self._rule_keywords) if not satisfied[index]]
+        tail = ""
+        for chunk in chunks:
+            text = tail + chunk
+            missing = []
+            for index, keywords in remaining:
+                if any(keyword in text for keyword in keywords):
+                    satisfied[index] = True
+                else:
+                    missing.append((index, keywords))
+            remaining = missing
+            if not remaining:
+                break
+            tail = text[-self._overlap:] if self._overlap else ""
+        return satisfied
+
+    def match(
+        self,
+        form_text: Union[str, Iterable[str]],
+        regulations: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Split the regulation set into (matched_rules, missing_rules).
+
+        `form_text` is lowercased on the fly, chunk by chunk. `regulations` may
+        be any rule list with the same fingerprint as the compiled one.
+        """
+        if isinstance(form_text, str):
+            form_text = (form_text,)
+        chunks = (chunk.lower() for chunk in form_text)
+        if self.substring_scan:
+            satisfied = self._satisfied_by_substrings(chunks)
+        else:
+            found = self._keywords.scan(chunks)
+            satisfied = [not found.isdisjoint(keyword_ids) for keyword_ids in self._rule_keyword_ids]
+        matched_rules = []
+        missing_rules = []
+        for rule, ok in zip(self.regulations if regulations is None else regulations, satisfied):
+            if ok:
+                matched_rules.append(rule)
+            else:
+                missing_rules.append(rule)
+        return matched_rules, missing_rules
+
+
+def regulation_fingerprint(regulations: List[Dict[str, Any]]) -> Tuple[Tuple[str, ...], ...]:
+    return tuple(tuple(kw.lower() for kw in rule.get("keywords", [])) for rule in regulations)
+
+
+_MATCHER_CACHE_SIZE = 8
+_matcher_cache: Dict[Tuple[Tuple[str, ...], ...], RuleMatcher] = {}
+
+
+def get_rule_matcher(regulations: List[Dict[str, Any]]) -> RuleMatcher:
+    """Return a compiled matcher for `regulations`, reusing one built for an identical set.
+
+    The cached matcher may hold a different (but equivalent) list, so callers
+    pass their own `regulations` to `RuleMatcher.match`.
+    """
+    key = regulation_fingerprint(regulations)
+    matcher = _matcher_cache.pop(key, None)
+    if matcher is None:
+        matcher = RuleMatcher(regulations)
+    _matcher_cache[key] = matcher
+    while len(_matcher_cache) > _MATCHER_CACHE_SIZE:
+        _matcher_cache.pop(next(iter(_matcher_cache)))
+    return matcher
+
+
+# --- Lemma Index ---
+# An inverted index from normalized keyword tokens to rules, for matching
+# inflected and derived forms ("encrypted" vs. "encryption"). Each keyword is
+# posted under its rarest token only, so a form's candidate rules come from
+# looking up the form's distinct tokens, independent of the size of the
+# rule library; candidates are then verified as contiguous token phrases.
+
+_WORD = re.compile(r"\w+(?:[.,']\w+)*")
+# Longest first; stripped only when at least four characters remain.
+_SUFFIXES = ("ations", "ation", "ments", "ment", "ings", "ions", "ing", "ion", "ies", "age", "ed", "es", "ly", "s")
+NORMALIZER_VERSION = "1"
+
+
+def stem(word: str) -> str:
+    """A light suffix-stripping stemmer: "encrypted", "encryption" and "encrypts" all become "encrypt"."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            if suffix == "s" and word.endswith("ss"):
+                break
+            word = word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+            break
+    if len(word) > 4 and word.endswith("e"):
+        word = word[:-1]
+    return word
+
+
+def iter_tokens(chunks: Union[str, Iterable[str]]) -> Iterator[str]:
+    """Normalized (lowercased, stemmed) word tokens of a text given as one string or a stream of chunks."""
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    tail = ""
+    for chunk in chunks:
+        text = tail + chunk.lower()
+        tail = ""
+        for match in _WORD.finditer(text):
+            if match.end() == len(text):
+                tail = match.group()  # may continue in the next chunk
+            else:
+                yield stem(match.group())
+    if tail:
+        yield stem(tail)
+
+
+Tokenizer = Callable[[Union[str, Iterable[str]]], Iterator[str]]
+
+
+class LemmaIndex:
+    """Inverted index over one regulation set; see `match`."""
+
+    def __init__(self, regulations: List[Dict[str, Any]], tokenize: Tokenizer = iter_tokens, state: Dict[str, Any] = None):
+        self.regulations = regulations
+        if state is None:
+            state = self.build_state(regulations, tokenize)
+        self._tokenize = tokenize
+        # rule id -> keywords as token tuples; () is the empty keyword, which always matches.
+        self._keywords: List[List[Tuple[str, ...]]] = [[tuple(kw) for kw in keywords] for keywords in state["keywords"]]
+        self._postings: Dict[str, List[Tuple[int, int]]] = {
+            token: [tuple(posting) for posting in postings] for token, postings in state["postings"].items()
+        }
+        self._always = [i for i, keywords in enumerate(self._keywords) if () in keywords]
+
+    @staticmethod
+    def build_state(regulations: List[Dict[str, Any]], tokenize: Tokenizer = iter_tokens) -> Dict[str, Any]:
+        """The index as plain JSON-serializable data, for persisting it."""
+        keywords = [[list(tokenize(kw)) for kw in rule.get("keywords", [])] for rule in regulations]
+        frequency: Dict[str, int] = defaultdict(int)
+        for rule_keywords in keywords:
+            for tokens in rule_keywords:
+                for token in set(tokens):
+                    frequency[token] += 1
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for rule_id, rule_keywords in enumerate(keywords):
+            for keyword_id, tokens in enumerate(rule_keywords):
+                if tokens:
+                    rarest = min(tokens, key=lambda token: (frequency[token], token))
+                    postings[rarest].append((rule_id, keyword_id))
+        return {"keywords": keywords, "postings": postings}
+
+    def state(self) -> Dict[str, Any]:
+        return {"keywords": [[list(kw) for kw in keywords] for keywords in self._keywords], "postings": self._postings}
+
+    def candidates(self, positions: Dict[str, List[int]]) -> Dict[int, List[int]]:
+        """Rule id -> ids of its keywords whose rarest token occurs in the form."""
+        found: Dict[int, List[int]] = defaultdict(list)
+        for token in positions:
+            for rule_id, keyword_id in self._postings.get(token, ()):
+                found[rule_id].append(keyword_id)
+        return found
+
+    @staticmethod
+    def _phrase_at(tokens: Tuple[str, ...], positions: Dict[str, List[int]]) -> bool:
+        # Whether the tokens occur consecutively anywhere in the form.
+        if any(token not in positions for token in tokens):
+            return False
+        if len(tokens) == 1:
+            return True
+        following = tokens[1:]
+        for start in positions[tokens[0]]:
+            for offset, token in enumerate(following, 1):
+                token_positions = positions[token]
+                i = bisect_left(token_positions, start + offset)
+                if i == len(token_positions) or token_positions[i] != start + offset:
+                    break
+            else:
+                return True
+        return False
+
+    def form_positions(self, form_text: Union[str, Iterable[str]]) -> Dict[str, List[int]]:
+        positions: Dict[str, List[int]] = defaultdict(list)
+        for i, token in enumerate(self._tokenize(form_text)):
+            positions[token].append(i)
+        return positions
+
+    def match(
+        self,
+        form_text: Union[str, Iterable[str]],
+        regulations: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Split the regulation set into (matched_rules, missing_rules), like `RuleMatcher.match`.
+
+        A rule matches when one of its keywords occurs in the form as a
+        phrase of normalized tokens.
+        """
+        positions = self.form_positions(form_text)
+        matched_ids = set(self._always)
+        for rule_id, keyword_ids in self.candidates(positions).items():
+            keywords = self._keywords[rule_id]
+            if any(self._phrase_at(keywords[k], positions) for k in keyword_ids):
+                matched_ids.add(rule_id)
+        matched_rules = []
+        missing_rules = []
+        for rule_id, rule in enumerate(self.regulations if regulations is None else regulations):
+            if rule_id in matched_ids:
+                matched_rules.append(rule)
+            else:
+                missing_rules.append(rule)
+        return matched_rules, missing_rules
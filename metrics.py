@@ -0,0 +1,327 @@
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# --- Metrics ---
+# Lightweight instrumentation for the analysis pipeline. Code marks its
+# stages (PDF extraction, spaCy, matching, persistence) with `stage()` and
+# counts the items it handles (pages, tokens, rules) with `count()`. Stage
+# times are exclusive: time spent in a nested stage, such as extracting text
+# that the matcher is consuming, is only charged to the inner one, so the
+# stages of a breakdown add up to the time actually spent.
+#
+# Inside `collect()` the numbers go to a per-call Timings breakdown instead
+# of the process-wide registry. Per-form work uses it so that work done in
+# pool processes travels back with the result; the job then merges it.
+
+# Item counts and the stage that processes them, for throughput rates.
+RATE_STAGES = {"pages": "pdf_extract", "tokens": "nlp", "rules": "match"}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+PREFIX = "exl_"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class Timings:
+    """Exclusive seconds and calls per stage, and item counts."""
+
+    def __init__(self):
+        self.stages: Dict[str, List[float]] = {}
+        self.counts: Dict[str, float] = {}
+
+    def add_stage(self, name: str, seconds: float, calls: int = 1):
+        totals = self.stages.setdefault(name, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += calls
+
+    def add_count(self, name: str, value: float):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def merge(self, other: Dict[str, Any]):
+        """Add a breakdown produced by `to_dict` (possibly in another process)."""
+        for name, totals in other["stages"].items():
+            self.add_stage(name, totals["seconds"], totals["calls"])
+        for name, value in other["counts"].items():
+            self.add_count(name, value)
+
+    def to_dict(self) -> Dict[str, Any]:
+        rates = {}
+        for name, stage_name in RATE_STAGES.items():
+            seconds = self.stages.get(stage_name, [0.0])[0]
+            if name in self.counts and seconds > 0:
+                rates[f"{name}_per_second"] = self.counts[name] / seconds
+        return {
+            "stages": {name: {"seconds": seconds, "calls": calls} for name, (seconds, calls) in self.stages.items()},
+            "counts": dict(self.counts),
+            "rates": rates,
+            "total_seconds": sum(seconds for seconds, _ in self.stages.values()),
+        }
+
+
+class Histogram:
+    def __init__(self, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, labels: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return name
+    text = ",".join(f'{key}="{_escape(value)}"' for key, value in pairs)
+    return f"{name}{{{text}}}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Process-wide counters, histograms and the cumulative stage breakdown."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = Timings()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, /, **labels):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, /, **labels):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            key = _label_key(labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self._timings.add_stage(name, seconds)
+
+    def add_count(self, name: str, value: float):
+        with self._lock:
+            self._timings.add_count(name, value)
+
+    def merge(self, timings: Dict[str, Any]):
+        with self._lock:
+            self._timings.merge(timings)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "timings": self._timings.to_dict(),
+                "counters": {
+                    _series(name, key): value for name, series in self._counters.items() for key, value in series.items()
+                },
+                "histograms": {
+                    _series(name, key): {"count": h.count, "sum": h.sum}
+                    for name, series in self._histograms.items()
+                    for key, h in series.items()
+                },
+            }
+
+    def prometheus(self) -> str:
+        """Everything in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            timings = self._timings.to_dict()
+            lines.append(f"# TYPE {PREFIX}stage_seconds_total counter")
+            for name, totals in timings["stages"].items():
+                lines.append(f"{_series(PREFIX + 'stage_seconds_total', (('stage', name),))} {_number(totals['seconds'])}")
+            lines.append(f"# TYPE {PREFIX}stage_calls_total counter")
+            for name, totals in timings["stages"].items():
+                lines.append(f"{_series(PREFIX + 'stage_calls_total', (('stage', name),))} {_number(totals['calls'])}")
+            for name, value in timings["counts"].items():
+                lines.append(f"# TYPE {PREFIX}{name}_total counter")
+                lines.append(f"{PREFIX}{name}_total {_number(value)}")
+            for name, series in self._counters.items():
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for key, value in series.items():
+                    lines.append(f"{_series(PREFIX + name, key)} {_number(value)}")
+            for name, series in self._histograms.items():
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for key, h in series.items():
+                    for bound, count in zip(h.buckets, h.counts):
+                        lines.append(f"{_series(PREFIX + name + '_bucket', key, (('le', _number(float(bound))),))} {count}")
+                    lines.append(f"{_series(PREFIX + name + '_bucket', key, (('le', '+Inf'),))} {h.count}")
+                    lines.append(f"{_series(PREFIX + name + '_sum', key)} {_number(h.sum)}")
+                    lines.append(f"{_series(PREFIX + name + '_count', key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Per thread: the open stages (each tracking time spent in its nested
+# stages) and the Timings that `collect()` routes numbers to, if any.
+_local = threading.local()
+
+
+def _stack() -> List[List[float]]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _sink():
+    return getattr(_local, "timings", None) or registry
+
+
+@contextmanager
+def collect() -> Iterator[Timings]:
+    """Send this thread's stage times and counts to a fresh Timings for the duration of the block."""
+    previous = getattr(_local, "timings", None)
+    previous_stack = getattr(_local, "stack", None)
+    timings = _local.timings = Timings()
+    _local.stack = []
+    try:
+        yield timings
+    finally:
+        _local.timings = previous
+        _local.stack = previous_stack
+
+
+@contextmanager
+def stage(name: str):
+    """Time the block as stage `name`, excluding time spent in nested stages."""
+    stack = _stack()
+    frame = [0.0]
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        if stack:
+            stack[-1][0] += elapsed
+        _sink().add_stage(name, elapsed - frame[0])
+
+
+def timed(name: str):
+    """Decorator: run the function as stage `name`."""
+
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def timed_iter(name: str, iterator: Iterable[Any]) -> Iterator[Any]:
+    """Yield from `iterator`, timing the production of each item as stage `name`."""
+    iterator = iter(iterator)
+    try:
+        while True:
+            with stage(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+    finally:
+        close = getattr(iterator, "close", None)
+        if close:
+            close()
+
+
+def merge(timings: Dict[str, Any]):
+    """Add a breakdown returned by other code (e.g. a pool worker's `Timings.to_dict()`)."""
+    _sink().merge(timings)
+
+
+def count(name: str, value: float = 1):
+    """Count `value` items of kind `name` (pages, tokens, rules...)."""
+    _sink().add_count(name, value)
+
+
+# Profiled blocks currently running, and whether the first of them started
+# tracemalloc: the last one to exit stops it, so concurrent ones (two
+# profiled jobs) do not cut each other's tracing short.
+_profiling = 0
+_profiling_started_tracing = False
+_profiling_lock = threading.Lock()
+
+
+def _start_tracing():
+    global _profiling, _profiling_started_tracing
+    with _profiling_lock:
+        if _profiling == 0:
+            _profiling_started_tracing = not tracemalloc.is_tracing()
+            if _profiling_started_tracing:
+                tracemalloc.start()
+        _profiling += 1
+
+
+def _stop_tracing():
+    global _profiling
+    with _profiling_lock:
+        _profiling -= 1
+        if _profiling == 0 and _profiling_started_tracing:
+            tracemalloc.stop()
+
+
+@contextmanager
+def profile(dump_path: Optional[str] = None, top: int = 25) -> Iterator[Dict[str, Any]]:
+    """cProfile this thread and trace allocations for the duration of the block.
+
+    Yields a dict that is filled in when the block exits: the `top`
+    functions by cumulative time, peak traced memory and the `top`
+    allocation sites. tracemalloc sees every thread of the process, so
+    blocks profiled at the same time share their allocations and peak. With
+    `dump_path`, the raw profile is also saved there for pstats/snakeviz.
+    """
+    report: Dict[str, Any] = {}
+    _start_tracing()
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield report
+        finally:
+            profiler.disable()
+            after = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+    finally:
+        _stop_tracing()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+        report["cpu"] = out.getvalue()
+        report["peak_memory_bytes"] = peak
+        report["allocations"] = [str(stat) for stat in after.compare_to(before, "lineno")[:top]]
+        if dump_path:
+            profiler.dump_stats(dump_path)
+            report["profile_file"] = dump_path
@@ -0,0 +1,384 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, FrozenSet, Iterator, List, Optional
+
+from jobs import ACTIVE_STATES, background_loop
+from storage import acquire_file_lock, file_lock, read_json_file, release_file_lock, write_json_file
+
+# --- Recurring Schedules ---
+# Analyses that run every so often (an interval or a cron expression), each
+# against its own forms folder and regulation set. The schedules live in a
+# JSON file, so they survive restarts, and any process may edit it under a
+# file lock. One process at a time, whichever holds the runner lock, fires
+# them: its runner is a coroutine on the background event loop that sleeps
+# until the next run is due (or the file may have changed), hands due runs to
+# the job scheduler and goes back to sleep.
+
+CATCH_UP_POLICIES = ("skip", "once", "all")
+# A run starting more than this late was missed (the app was down or the
+# machine asleep); the schedule's catch-up policy decides what happens then:
+# "skip" it, run "once" for however many were missed, or make up "all" of
+# them one after the other (at most MAX_CATCH_UP_RUNS).
+MISFIRE_GRACE_SECONDS = 60
+MAX_CATCH_UP_RUNS = 10
+# How often the runner re-reads the schedules (edits made by other
+# processes), checks on its runs and, while another process is the runner,
+# tries to take over.
+POLL_SECONDS = 5.0
+# Upcoming firings of a cron schedule whose spacing bounds its jitter: a run
+# must never be pushed past the next one.
+CRON_GAP_SAMPLE = 50
+
+_CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+_CRON_NAMES = {
+    "month": {name: i + 1 for i, name in enumerate("jan feb mar apr may jun jul aug sep oct nov dec".split())},
+    "weekday": {name: i for i, name in enumerate("sun mon tue wed thu fri sat".split())},
+}
+_CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+}
+
+
+def _parse_cron_field(text: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    def value(token: str) -> int:
+        number = _CRON_NAMES.get(name, {}).get(token)
+        return number if number is not None else int(token)
+
+    values = set()
+    try:
+        for part in text.lower().split(","):
+            body, slash, step = part.partition("/")
+            step = int(step) if slash else 1
+            if body == "*":
+                start, end = low, high
+            elif "-" in body:
+                first, last = body.split("-", 1)
+                start, end = value(first), value(last)
+            else:
+                start = value(body)
+                end = high if slash else start  # "5/15" means 5-59/15
+            if step < 1 or not low <= start <= end <= high:
+                raise ValueError
+            values.update(range(start, end + 1, step))
+    except ValueError:
+        raise ValueError(f"Invalid cron {name} field: {text!r}") from None
+    if name == "weekday" and 7 in values:
+        values.discard(7)
+        values.add(0)  # 7 is Sunday too
+    return frozenset(values)
+
+
+class CronExpression:
+    """A five-field cron expression (minute hour day-of-month month day-of-week), in local time.
+
+    Fields take `*`, numbers, ranges (`1-5`), steps (`*/15`, `0-30/10`),
+    lists and month or weekday names; `@daily` and the other usual aliases
+    work too. As in cron, when both day fields are restricted a day matching
+    either one qualifies.
+    """
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = _CRON_ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression {expression!r} should have 5 fields, not {len(fields)}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_cron_field(text, *spec) for text, spec in zip(fields, _CRON_FIELDS)
+        )
+        self._any_day = fields[2].startswith("*")
+        self._any_weekday = fields[4].startswith("*")
+        self.next_after(datetime.now())  # rejects expressions that never fire, e.g. "0 0 30 2 *"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = moment.isoweekday() % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """The first matching minute strictly after `moment`."""
+        t = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        end = t + timedelta(days=366 * 8)  # long enough for February 29th
+        while t < end:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression {self.expression!r} never fires")
+
+    def shortest_gap(self, moment: datetime, fires: int = CRON_GAP_SAMPLE) -> timedelta:
+        """The shortest time between two of the next `fires` firings after `moment`."""
+        times = [self.next_after(moment)]
+        while len(times) < fires:
+            times.append(self.next_after(times[-1]))
+        return min(later - earlier for earlier, later in zip(times, times[1:]))
+
+
+def next_run(schedule: Dict[str, Any], after: datetime) -> datetime:
+    """The first run time of `schedule` strictly after `after`, before jitter.
+
+    Interval schedules stay on the grid set by their creation time, so late
+    or jittered runs do not make them drift.
+    """
+    if schedule.get("cron"):
+        return CronExpression(schedule["cron"]).next_after(after)
+    interval = timedelta(seconds=schedule["interval_seconds"])
+    anchor = datetime.fromisoformat(schedule["created_at"])
+    periods = max(1, (after - anchor) // interval + 1)
+    return anchor + periods * interval
+
+
+def _jittered(schedule: Dict[str, Any], moment: datetime) -> str:
+    # Spread schedules that share a time over the next `jitter_seconds`.
+    return (moment + timedelta(seconds=random.uniform(0, schedule["jitter_seconds"]))).isoformat()
+
+
+def new_schedule(
+    name: str,
+    cron: Optional[str] = None,
+    interval_seconds: Optional[float] = None,
+    forms_dir: Optional[str] = None,
+    regulations_file: Optional[str] = None,
+    regulations_dir: Optional[str] = None,
+    catch_up: str = "once",
+    jitter_seconds: float = 0,
+    max_concurrency: Optional[int] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """A validated schedule record (ValueError otherwise). None paths mean the app's defaults."""
+    if not name:
+        raise ValueError("A schedule needs a name.")
+    if (cron is None) == (interval_seconds is None):
+        raise ValueError("Give either a cron expression or an interval.")
+    if cron is not None:
+        period = CronExpression(cron).shortest_gap(datetime.now()).total_seconds()
+    elif interval_seconds <= 0:
+        raise ValueError("The interval must be positive.")
+    else:
+        period = interval_seconds
+    if catch_up not in CATCH_UP_POLICIES:
+        raise ValueError(f"Unknown catch-up policy {catch_up!r}; use one of {', '.join(CATCH_UP_POLICIES)}.")
+    if jitter_seconds < 0 or jitter_seconds >= period:
+        raise ValueError(f"The jitter must be at least 0 and shorter than the time between runs ({period:g}s).")
+    if max_concurrency is not None and max_concurrency < 1:
+        raise ValueError("The concurrency limit must be at least 1.")
+    forms_dir, regulations_file, regulations_dir = (
+        os.path.normpath(path) if path else None for path in (forms_dir, regulations_file, regulations_dir)
+    )
+    for path in (forms_dir, regulations_dir):
+        if path is not None and not os.path.isdir(path):
+            raise ValueError(f"No such folder: {path}")
+    if regulations_file is not None and not os.path.isfile(regulations_file):
+        raise ValueError(f"No such file: {regulations_file}")
+    now = datetime.now()
+    schedule = {
+        "schedule_id": str(uuid.uuid4()),
+        "name": name,
+        "cron": cron,
+        "interval_seconds": interval_seconds,
+        "forms_dir": forms_dir,
+        "regulations_file": regulations_file,
+        "regulations_dir": regulations_dir,
+        "catch_up": catch_up,
+        "jitter_seconds": jitter_seconds,
+        "max_concurrency": max_concurrency,
+        "force": force,
+        "enabled": True,
+        "created_at": now.isoformat(),
+        "next_run_at": None,
+        "last_run_at": None,
+        "last_job_id": None,
+        "last_outcome": None,
+        "catch_up_runs": 0,
+    }
+    schedule["next_run_at"] = _jittered(schedule, next_run(schedule, now))
+    return schedule
+
+
+class ScheduleBook:
+    """The schedules file: a JSON array of schedule records, edited by any process under a file lock."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self) -> List[Dict[str, Any]]:
+        return read_json_file(self.path)
+
+    @contextmanager
+    def edit(self) -> Iterator[List[Dict[str, Any]]]:
+        """The schedules, to modify in place; written back (if changed) when the block exits."""
+        with file_lock(self.path):
+            schedules = read_json_file(self.path)
+            before = json.dumps(schedules)
+            yield schedules
+            if json.dumps(schedules) != before:
+                write_json_file(self.path, schedules)
+
+    def add(self, schedule: Dict[str, Any]):
+        with self.edit() as schedules:
+            schedules.append(schedule)
+
+    def remove(self, schedule_id: str) -> bool:
+        with self.edit() as schedules:
+            kept = [s for s in schedules if s["schedule_id"] != schedule_id]
+            removed = len(kept) < len(schedules)
+            schedules[:] = kept
+        return removed
+
+    def set_enabled(self, schedule_id: str, enabled: bool) -> Optional[Dict[str, Any]]:
+        with self.edit() as schedules:
+            schedule = next((s for s in schedules if s["schedule_id"] == schedule_id), None)
+            if schedule is not None and schedule["enabled"] != enabled:
+                schedule["enabled"] = enabled
+                schedule["catch_up_runs"] = 0
+                if enabled:
+                    # Runs that fell in the pause were not missed.
+                    schedule["next_run_at"] = _jittered(schedule, next_run(schedule, datetime.now()))
+        return schedule
+
+
+class ScheduleRunner:
+    """Fires the due schedules of a ScheduleBook from the background event loop.
+
+    `start_run(schedule)` starts a run (without waiting for it) and returns
+    its job id, or None when it could not be started (e.g. a full queue);
+    `run_state(job_id)` is the job's state, or None for a job this process
+    does not know. A schedule never has two runs active at once: a run that
+    comes due while the previous one is still going is skipped.
+    """
+
+    def __init__(
+        self,
+        book: ScheduleBook,
+        start_run: Callable[[Dict[str, Any]], Optional[str]],
+        run_state: Callable[[str], Optional[str]],
+        poll_seconds: float = POLL_SECONDS,
+    ):
+        self.book = book
+        self.start_run = start_run
+        self.run_state = run_state
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._future: Optional[Future] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner_lock = None
+
+    @property
+    def is_runner(self) -> bool:
+        """Whether this process is the one firing the schedules."""
+        return self._runner_lock is not None
+
+    def start(self):
+        with self._lock:
+            if self._future is None:
+                self._loop = background_loop()
+                self._future = asyncio.run_coroutine_threadsafe(self._run(), self._loop)
+
+    def stop(self):
+        with self._lock:
+            future, self._future = self._future, None
+        if future is not None:
+            future.cancel()
+
+    def wake(self):
+        """Look at the schedules now rather than at the next poll (e.g. after an edit)."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                delay = self.poll_seconds
+                if self._runner_lock is None:
+                    self._runner_lock = acquire_file_lock(f"{self.book.path}.runner", blocking=False)
+                if self._runner_lock is not None:
+                    # The schedules file's lock may be held by an editor in
+                    # another process, so the tick waits for it off the loop.
+                    try:
+                        tick = await asyncio.get_running_loop().run_in_executor(None, self.tick, datetime.now())
+                        delay = min(delay, tick)
+                    except Exception as e:  # e.g. an unreadable file; try again at the next poll
+                        print(f"Error running schedules from {self.book.path}: {e}")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            if self._runner_lock is not None:
+                release_file_lock(self._runner_lock)
+                self._runner_lock = None
+
+    def tick(self, now: datetime) -> float:
+        """Start the runs due at `now`; returns the seconds until the next one is due."""
+        next_due = None
+        with self.book.edit() as schedules:
+            for schedule in schedules:
+                self._record_outcome(schedule)
+                if not schedule["enabled"]:
+                    continue
+                if datetime.fromisoformat(schedule["next_run_at"]) <= now:
+                    self._fire(schedule, now)
+                elif schedule["catch_up_runs"] and not self._active(schedule):
+                    schedule["catch_up_runs"] -= 1
+                    self._start(schedule, now)
+                due = datetime.fromisoformat(schedule["next_run_at"])
+                next_due = due if next_due is None else min(next_due, due)
+        return self.poll_seconds if next_due is None else max(0.0, (next_due - now).total_seconds())
+
+    def _fire(self, schedule: Dict[str, Any], now: datetime):
+        due = datetime.fromisoformat(schedule["next_run_at"])
+        if now - due <= timedelta(seconds=MISFIRE_GRACE_SECONDS):
+            self._start(schedule, now)
+        elif schedule["catch_up"] == "skip":
+            schedule["last_outcome"] = "missed"
+        else:
+            if schedule["catch_up"] == "all":
+                missed, moment = 0, due
+                while moment <= now and missed < MAX_CATCH_UP_RUNS:
+                    missed += 1
+                    moment = next_run(schedule, moment)
+                schedule["catch_up_runs"] = min(MAX_CATCH_UP_RUNS, schedule["catch_up_runs"] + missed - 1)
+            self._start(schedule, now)
+        schedule["next_run_at"] = _jittered(schedule, next_run(schedule, now))
+
+    def _active(self, schedule: Dict[str, Any]) -> bool:
+        return bool(schedule["last_job_id"]) and self.run_state(schedule["last_job_id"]) in ACTIVE_STATES
+
+    def _start(self, schedule: Dict[str, Any], now: datetime):
+        if self._active(schedule):
+            schedule["last_outcome"] = "skipped: previous run still active"
+            return
+        job_id = self.start_run(dict(schedule))
+        schedule["last_run_at"] = now.isoformat()
+        schedule["last_job_id"] = job_id
+        schedule["last_outcome"] = "started" if job_id else "skipped: queue full"
+
+    def _record_outcome(self, schedule: Dict[str, Any]):
+        # "started" becomes the run's final state once it is known.
+        if schedule["last_outcome"] == "started":
+            state = self.run_state(schedule["last_job_id"])
+            if state is not None and state not in ACTIVE_STATES:
+                schedule["last_outcome"] = state
@@ -0,0 +1,164 @@
+import io
+import re
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from matcher import NORMALIZER_VERSION, iter_tokens, stem
+
+# --- Semantic Matching ---
+# Rules and form sentences as unit vectors. A rule is satisfied when some
+# sentence of the form is similar enough to its requirement (cosine
+# similarity at or above a threshold), so regulator phrasing does not have
+# to appear word for word. Scoring a form is one matrix product of the rule
+# vectors (rules x dim) with the sentence vectors (dim x sentences), taken in
+# blocks of sentences so memory stays bounded.
+
+# Form text is cut at sentence ends, and run-on text into windows of this many words.
+SENTENCE_MAX_WORDS = 40
+# Sentences scored per matrix product.
+SCORE_BLOCK = 2048
+HASH_DIM = 512
+
+_SENTENCE_BREAK = re.compile(r"(?<=[.?!;])\s+")
+_STOP_WORDS = frozenset(
+    stem(word)
+    for word in (
+        "a an and any are as at be been by each for from has have in into is it its may must no not of on or "
+        "shall should such that the their there these this those to was were which will with within"
+    ).split()
+)
+
+
+def _windows(text: str, max_words: int) -> Iterator[str]:
+    words = text.split()
+    for start in range(0, len(words), max_words):
+        yield " ".join(words[start:start + max_words])
+
+
+def iter_sentences(chunks: Union[str, Iterable[str]], max_words: int = SENTENCE_MAX_WORDS) -> Iterator[str]:
+    """Sentences (at most `max_words` words each) of a text given as one string or a stream of chunks."""
+    if isinstance(chunks, str):
+        chunks = (chunks,)
+    buffer = ""
+    for chunk in chunks:
+        buffer += chunk
+        parts = _SENTENCE_BREAK.split(buffer)
+        buffer = parts.pop()
+        for part in parts:
+            yield from _windows(part, max_words)
+        # Text without sentence ends is emitted in full windows as it arrives.
+        buffer = buffer.lstrip()
+        words = buffer.split(" ", max_words)
+        while len(words) > max_words:
+            yield " ".join(words[:max_words])
+            buffer = words[max_words]
+            words = buffer.split(" ", max_words)
+    if buffer.strip():
+        yield from _windows(buffer, max_words)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class HashingEmbedder:
+    """Stemmed content words and word pairs, hashed into `dim` signed buckets.
+
+    Needs no model; similar sentences are those sharing (normalized) words
+    and word pairs, whatever their order or inflection.
+    """
+
+    default_threshold = 0.3
+
+    def __init__(self, dim: int = HASH_DIM):
+        self.dim = dim
+        self.version = f"hashing-{dim}/{NORMALIZER_VERSION}/1"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = [token for token in iter_tokens(text) if token not in _STOP_WORDS]
+            for feature in tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]:
+                # crc32, unlike hash(), is the same in every process.
+                h = zlib.crc32(feature.encode("utf-8"))
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return normalize_rows(matrix)
+
+
+class SpacyVectorEmbedder:
+    """Mean word vector of the content words, from a spaCy model with static vectors (e.g. en_core_web_md)."""
+
+    default_threshold = 0.75
+
+    def __init__(self, nlp, model_version: str):
+        self._nlp = nlp
+        self.dim = nlp.vocab.vectors_length
+        self.version = f"spacy-vectors/{model_version}/1"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        # Only the tokenizer runs; the vectors come straight from the vocab.
+        for row, doc in enumerate(self._nlp.tokenizer.pipe(texts)):
+            vectors = [t.vector for t in doc if t.has_vector and not (t.is_stop or t.is_punct or t.is_space)]
+            if vectors:
+                matrix[row] = np.mean(vectors, axis=0)
+        return normalize_rows(matrix)
+
+
+def rule_text(rule: Dict[str, Any]) -> str:
+    return rule.get("requirement") or " ".join(rule.get("keywords", []))
+
+
+def to_bytes(matrix: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, matrix, allow_pickle=False)
+    return buffer.getvalue()
+
+
+def from_bytes(data: bytes) -> np.ndarray:
+    return np.load(io.BytesIO(data), allow_pickle=False)
+
+
+class SemanticIndex:
+    """Requirement vectors of one regulation set; see `match_vectors`."""
+
+    def __init__(self, regulations: List[Dict[str, Any]], embedder, vectors: Optional[np.ndarray] = None):
+        self.regulations = regulations
+        self.embedder = embedder
+        self.vectors = embedder.embed([rule_text(rule) for rule in regulations]) if vectors is None else vectors
+
+    def embed_form(self, form_text: Union[str, Iterable[str]]) -> np.ndarray:
+        """Vectors of the form's sentences (cache them by content hash: this is the expensive part)."""
+        sentences = list(iter_sentences(form_text))
+        if not sentences:
+            return np.zeros((0, self.embedder.dim), dtype=np.float32)
+        return self.embedder.embed(sentences)
+
+    def scores(self, form_vectors: np.ndarray) -> np.ndarray:
+        """Best similarity of each rule to any sentence of the form (-1 when the form has none)."""
+        best = np.full(len(self.vectors), -1.0, dtype=np.float32)
+        for start in range(0, len(form_vectors), SCORE_BLOCK):
+            block = self.vectors @ form_vectors[start:start + SCORE_BLOCK].T
+            np.maximum(best, block.max(axis=1), out=best)
+        return best
+
+    def match_vectors(
+        self,
+        form_vectors: np.ndarray,
+        threshold: float,
+        regulations: Optional[List[Dict[str, Any]]] = None,
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """Split the regulation set into (matched_rules, missing_rules), like `RuleMatcher.match`."""
+        satisfied = self.scores(form_vectors) >= threshold
+        matched_rules = []
+        missing_rules = []
+        for rule, ok in zip(self.regulations if regulations is None else regulations, satisfied):
+            if ok:
+                matched_rules.append(rule)
+            else:
+                missing_rules.append(rule)
+        return matched_rules, missing_rules
@@ -0,0 +1,1166 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import IO, List, Dict, Any, Callable, Iterable, Iterator, Optional, Set, Tuple, Union
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# --- Report Storage ---
+# Reports and alerts are stored through a small pluggable interface. The JSON
+# backend keeps the original reports.json / alerts.json layout; the SQLite
+# backend appends rows to an indexed database instead of rewriting history.
+# Either way the rules a report found missing are stored once, in a rule
+# table, and referenced by id (see "Rule Table" below).
+
+
+ObjectHook = Optional[Callable[[Dict[str, Any]], Any]]
+
+
+@metrics.timed("json_read")
+def read_json_file(filepath: str, object_hook: ObjectHook = None) -> List[Dict[str, Any]]:
+    if not os.path.exists(filepath) or os.path.getsize(filepath) == 0:
+        return []
+    with open(filepath, "r", encoding="utf-8") as f:
+        return json.load(f, object_hook=object_hook)
+
+
+@metrics.timed("json_write")
+def write_json_file(filepath: str, data: List[Dict[str, Any]]):
+    """Replace `filepath` atomically: readers and crashes see the old file or the new one, never half of it."""
+    tmp_path = f"{filepath}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filepath)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def acquire_file_lock(path: str, blocking: bool = True) -> Optional[IO[bytes]]:
+    """Take an exclusive lock on `path`.lock, shared with other processes.
+
+    Returns the open lock file, to pass to `release_file_lock`; without
+    `blocking`, None when another process holds the lock.
+    """
+    f = open(f"{path}.lock", "a+b")
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        if blocking:
+            raise
+        return None
+    return f
+
+
+def release_file_lock(f: IO[bytes]):
+    try:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+
+@contextmanager
+def file_lock(path: str):
+    """An exclusive lock on `path`.lock, held across processes for the duration of the block."""
+    f = acquire_file_lock(path)
+    try:
+        yield
+    finally:
+        release_file_lock(f)
+
+
+# --- JSON Record Logs ---
+# A JSON array of records (reports.json) plus a JSON-lines log of the records
+# appended since (reports.jsonl). Appending writes only the new lines, under
+# a file lock; once the log has grown to a fraction of the array, the two are
+# compacted back into the array, written to a temporary file and renamed over
+# it. A crash can only leave a partial last line in the log, which readers
+# skip and the next append cuts off.
+
+# The log is folded into the array once it is at least this big and at least
+# COMPACT_RATIO times the array's size, so compaction's cost stays
+# proportional to the records appended since the last one.
+COMPACT_MIN_BYTES = 1024 * 1024
+COMPACT_RATIO = 0.5
+
+
+def log_path(filepath: str) -> str:
+    return f"{filepath}l"
+
+
+def _iter_log(path: str, object_hook: ObjectHook = None) -> Iterator[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return
+    for line in lines:
+        if line.endswith("\n"):
+            yield json.loads(line, object_hook=object_hook)
+        # else: an append cut short by a crash, ignored
+
+
+@metrics.timed("json_read")
+def read_json_records(filepath: str, id_field: str, object_hook: ObjectHook = None) -> List[Dict[str, Any]]:
+    """The array's records followed by the logged ones, oldest first."""
+    # The log is read before the array: a compaction in between then shows
+    # up as duplicates (dropped by id) rather than as missing records.
+    logged = list(_iter_log(log_path(filepath), object_hook))
+    records = read_json_file(filepath, object_hook)
+    if logged:
+        seen = {record.get(id_field) for record in records}
+        records.extend(record for record in logged if record.get(id_field) not in seen)
+    return records
+
+
+def _cut_partial_line(f):
+    # Drop the tail of an append that was interrupted, so the next one starts on a fresh line.
+    size = f.seek(0, os.SEEK_END)
+    if size == 0:
+        return
+    f.seek(size - 1)
+    if f.read(1) == b"\n":
+        return
+    f.seek(0)
+    data = f.read()
+    f.truncate(data.rfind(b"\n") + 1)
+    f.seek(0, os.SEEK_END)
+
+
+@metrics.timed("json_append")
+def append_json_records(filepath: str, records: List[Dict[str, Any]], id_field: str):
+    """Append `records` to the log of `filepath`, compacting the log into the array when it is due.
+
+    The caller holds `file_lock(filepath)`.
+    """
+    path = log_path(filepath)
+    with open(path, "a+b") as f:
+        _cut_partial_line(f)
+        f.write("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+        log_size = f.tell()
+    array_size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+    if log_size >= max(COMPACT_MIN_BYTES, COMPACT_RATIO * array_size):
+        compact_json_records(filepath, id_field)
+
+
+def compact_json_records(filepath: str, id_field: str):
+    """Fold the log into the array. The caller holds `file_lock(filepath)`."""
+    if os.path.exists(log_path(filepath)):
+        replace_json_records(filepath, read_json_records(filepath, id_field))
+
+
+def replace_json_records(filepath: str, records: List[Dict[str, Any]]):
+    """Write `records` as the array and drop the log. The caller holds `file_lock(filepath)`."""
+    path = log_path(filepath)
+    write_json_file(filepath, records)
+    # A crash right here leaves records in both files; readers drop the duplicates.
+    if os.path.exists(path):
+        os.remove(path)
+
+
+
+# A record log indexed by position and id: where each record starts in the
+# array or the log, so single records and pages can be read without decoding
+# the whole history. The index lives in memory and is brought up to date on
+# use, from the log lines appended since (cheap) or, when the array was
+# rewritten (a compaction), from scratch.
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class _StaleIndex(Exception):
+    pass
+
+
+class JsonRecordIndex:
+    """Positions and ids of the records `read_json_records` returns, with their byte ranges."""
+
+    def __init__(self, filepath: str, id_field: str):
+        self.filepath = filepath
+        self.id_field = id_field
+        self._lock = threading.Lock()
+        self._array_state = None  # (size, mtime_ns) of the indexed array
+        self._log_state = None  # (inode, indexed bytes) of the indexed log
+        self._array_count = 0
+        # (id, in the log?, offset, length), in list order, and the first position of each id.
+        self._entries: List[Tuple[Any, bool, int, int]] = []
+        self._positions: Dict[Any, int] = {}
+
+    @staticmethod
+    def _stat(path: str) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+
+    def _scan_array(self) -> Tuple[Tuple[int, int], List[Tuple[Any, bool, int, int]]]:
+        try:
+            f = open(self.filepath, "rb")
+        except OSError:
+            return (0, 0), []
+        with f:
+            st = os.fstat(f.fileno())
+            # Latin-1 maps every byte to one character, so text positions are byte offsets.
+            text = f.read().decode("latin-1")
+        entries = []
+        if text.strip():
+            decoder = json.JSONDecoder()
+            pos = _JSON_WHITESPACE.match(text, text.index("[") + 1).end()
+            while text[pos] != "]":
+                record, end = decoder.raw_decode(text, pos)
+                entries.append((record.get(self.id_field), False, pos, end - pos))
+                pos = _JSON_WHITESPACE.match(text, end).end()
+                if text[pos] == ",":
+                    pos = _JSON_WHITESPACE.match(text, pos + 1).end()
+        return (st.st_size, st.st_mtime_ns), entries
+
+    def _scan_log(self, start: int) -> Tuple[int, List[Tuple[Any, bool, int, int]]]:
+        # Complete lines from `start` on (a partial last line is left for later), and where they end.
+        try:
+            with open(log_path(self.filepath), "rb") as f:
+                f.seek(start)
+                data = f.read()
+        except OSError:
+            return start, []
+        entries = []
+        offset = start
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            entries.append((json.loads(line).get(self.id_field), True, offset, len(line)))
+            offset += len(line)
+        return offset, entries
+
+    def _add(self, entries: List[Tuple[Any, bool, int, int]]):
+        for entry in entries:
+            position = self._positions.get(entry[0])
+            if entry[1] and position is not None and position < self._array_count:
+                continue  # also in the array: left behind by a compaction cut short
+            self._positions.setdefault(entry[0], len(self._entries))
+            self._entries.append(entry)
+
+    def _state(self) -> Tuple[Tuple[int, int], Optional[int], int]:
+        # (array size and mtime, log inode, log size) as they are now.
+        array = self._stat(self.filepath)
+        log = self._stat(log_path(self.filepath))
+        return (
+            (array.st_size, array.st_mtime_ns) if array else (0, 0),
+            log.st_ino if log else None,
+            log.st_size if log else 0,
+        )
+
+    def _sync(self, rebuild: bool = False):
+        # Called with self._lock held.
+        array_state, log_inode, log_size = self._state()
+        indexed = self._log_state
+        if (
+            not rebuild
+            and array_state == self._array_state
+            and indexed is not None
+            and indexed[0] in (log_inode, None)
+            and indexed[1] <= log_size
+        ):
+            if log_size > indexed[1]:
+                end, entries = self._scan_log(indexed[1])
+                self._add(entries)
+                self._log_state = (log_inode, end)
+            return
+        # As in read_json_records, the log is read before the array. If the
+        # array read is not the one that was there before, a compaction came
+        # in between and the log read may be the old one: start over.
+        while True:
+            end, logged = self._scan_log(0)
+            scanned_state, entries = self._scan_array()
+            if scanned_state == array_state:
+                break
+            array_state, log_inode, _ = self._state()
+        self._array_state = array_state
+        self._log_state = (log_inode, end)
+        self._array_count = len(entries)
+        self._entries = entries
+        self._positions = {}
+        for position, entry in enumerate(entries):
+            self._positions.setdefault(entry[0], position)
+        self._add(logged)
+
+    def _read(self, entries: Iterable[Tuple[Any, bool, int, int]], object_hook: ObjectHook) -> Iterator[Dict[str, Any]]:
+        # Raises _StaleIndex when a file changed under the index.
+        files: Dict[bool, IO[bytes]] = {}
+        try:
+            for record_id, in_log, offset, length in entries:
+                if in_log not in files:
+                    try:
+                        files[in_log] = open(log_path(self.filepath) if in_log else self.filepath, "rb")
+                    except OSError:
+                        raise _StaleIndex()
+                f = files[in_log]
+                f.seek(offset)
+                try:
+                    record = json.loads(f.read(length), object_hook=object_hook)
+                except ValueError:
+                    raise _StaleIndex()
+                if not isinstance(record, dict) or record.get(self.id_field) != record_id:
+                    raise _StaleIndex()
+                yield record
+        finally:
+            for f in files.values():
+                f.close()
+
+    def newest(
+        self,
+        matches: Callable[[Dict[str, Any]], bool],
+        count: int,
+        before: Optional[int] = None,
+        object_hook: ObjectHook = None,
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """Up to `count` (position, record) pairs that `matches`, newest first, below position `before`.
+
+        Records are read one by one from the end, so the cost is that of the
+        records walked, not of the whole history.
+        """
+        for attempt in range(2):
+            with self._lock:
+                self._sync(rebuild=attempt > 0)
+                entries = self._entries
+                top = len(entries) if before is None else min(before, len(entries))
+            positions = range(top - 1, -1, -1)
+            records = self._read((entries[p] for p in positions), object_hook)
+            found = []
+            try:
+                for position, record in zip(positions, records):
+                    if matches(record):
+                        found.append((position, record))
+                        if len(found) >= count:
+                            break
+                return found
+            except _StaleIndex:
+                continue
+            finally:
+                records.close()
+        records = read_json_records(self.filepath, self.id_field, object_hook)
+        top = len(records) if before is None else min(before, len(records))
+        found = []
+        for position in range(top - 1, -1, -1):
+            if len(found) >= count:
+                break
+            if matches(records[position]):
+                found.append((position, records[position]))
+        return found
+
+    def get(self, record_ids: Iterable[Any], object_hook: ObjectHook = None) -> Dict[Any, Dict[str, Any]]:
+        """The records with the given ids (the first one of each id), read one by one."""
+        record_ids = list(record_ids)
+        for attempt in range(2):
+            with self._lock:
+                self._sync(rebuild=attempt > 0)
+                entries = [self._entries[self._positions[i]] for i in record_ids if i in self._positions]
+            try:
+                return {record[self.id_field]: record for record in self._read(entries, object_hook)}
+            except _StaleIndex:
+                continue
+        wanted = set(record_ids)
+        found: Dict[Any, Dict[str, Any]] = {}
+        for record in read_json_records(self.filepath, self.id_field, object_hook):
+            if record.get(self.id_field) in wanted:
+                found.setdefault(record[self.id_field], record)
+        return found
+
+
+# --- Rule Table ---
+# Stored reports do not embed the rules they found missing. Each rule is
+# kept once in a rule table under a stable id (a hash of its content), and a
+# report lists the ids and, per finding, the rule's risk level at the time:
+#
+#   {"report_id": ..., "missing_rule_ids": ["3f2a...", ...], "missing_risk_levels": ["High", ...]}
+#
+# An alert refers to its report and keeps only the risk levels, which is all
+# the dashboard aggregates need. `hydrate_record` turns a stored report back
+# into the full form (with "missing_rules") when one is opened. Records
+# written before the rule table existed embed full rule dicts; they are
+# interned the first time a store is opened and stay readable meanwhile.
+
+# Recorded per finding rather than in the rule table, so the same rule with
+# a revised risk level keeps its id and old reports keep their level.
+FINDING_FIELDS = ("rule_id", "risk_level")
+
+
+def rule_id(rule: Dict[str, Any]) -> str:
+    content = {key: value for key, value in rule.items() if key not in FINDING_FIELDS}
+    return hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def compact_record(record: Dict[str, Any], new_rules: Dict[str, Dict[str, Any]], rule_ids: bool = True) -> Dict[str, Any]:
+    """`record` with its missing rules replaced by ids and per-finding risk levels.
+
+    The rules are added to `new_rules` by id, for the rule table. Without
+    `rule_ids` only the risk levels are kept (alerts that name their report).
+    Records already in this layout are returned as is.
+    """
+    if "missing_rules" not in record:
+        return record
+    compact = {key: value for key, value in record.items() if key != "missing_rules"}
+    ids, levels = [], []
+    for rule in record["missing_rules"]:
+        levels.append(rule.get("risk_level"))
+        if rule_ids:
+            rid = rule.get("rule_id") or rule_id(rule)
+            if rid not in new_rules:
+                new_rules[rid] = {key: value for key, value in rule.items() if key not in FINDING_FIELDS}
+            ids.append(rid)
+    if rule_ids:
+        compact["missing_rule_ids"] = ids
+    compact["missing_risk_levels"] = levels
+    return compact
+
+
+def compact_alert(alert: Dict[str, Any], new_rules: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    # The rules of an alert are those of its report; older alerts without a report id keep their own.
+    return compact_record(alert, new_rules, rule_ids="report_id" not in alert)
+
+
+def hydrate_record(record: Dict[str, Any], rules: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """A stored record with its "missing_rules" rebuilt from the rule table."""
+    if "missing_rule_ids" not in record:
+        return record
+    hydrated = {key: value for key, value in record.items() if key not in ("missing_rule_ids", "missing_risk_levels")}
+    hydrated["missing_rules"] = [
+        dict(rules.get(rid, {}), rule_id=rid, risk_level=level)
+        for rid, level in zip(record["missing_rule_ids"], record["missing_risk_levels"])
+    ]
+    return hydrated
+
+
+def missing_risk_levels(record: Dict[str, Any]) -> List[Optional[str]]:
+    """The risk level of each missing rule of a report or alert, in either layout."""
+    if "missing_risk_levels" in record:
+        return record["missing_risk_levels"]
+    return [rule.get("risk_level") for rule in record.get("missing_rules", [])]
+
+
+def share_findings(record: Dict[str, Any]) -> Dict[str, Any]:
+    """json object hook: a single string object per distinct rule id and risk level.
+
+    The decoder otherwise creates a new string for every finding, which
+    would make the loaded history as big as if the rules were embedded.
+    """
+    for field in ("missing_rule_ids", "missing_risk_levels"):
+        values = record.get(field)
+        if values:
+            record[field] = [sys.intern(value) if isinstance(value, str) else value for value in values]
+    return record
+
+
+def referenced_rule_ids(records: Iterable[Dict[str, Any]]) -> Set[str]:
+    return {rid for record in records for rid in record.get("missing_rule_ids", ())}
+
+
+class RuleTable:
+    """Rules by id in a JSON object file, which only ever grows.
+
+    Kept in memory and re-read when the file changes (another process added
+    rules). Writers hold the store's lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._rules: Dict[str, Dict[str, Any]] = {}
+        self._state = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """The rules by id; do not modify."""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return {}
+        state = (st.st_size, st.st_mtime_ns)
+        if state != self._state:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._rules = json.load(f)
+            self._state = state
+        return self._rules
+
+    def add(self, rules: Dict[str, Dict[str, Any]]):
+        table = self.load()
+        new = {rid: rule for rid, rule in rules.items() if rid not in table}
+        if new or not self.exists():
+            write_json_file(self.path, dict(table, **new))
+
+
+# --- Report Listing ---
+# Listings return a lightweight projection of each report (no nested rules),
+# newest first, paged with an opaque cursor.
+
+RISK_LEVELS = ["Low", "Medium", "High"]
+SUMMARY_FIELDS = [
+    "report_id",
+    "filename",
+    "analysis_date",
+    "analysis_type",
+    "compliance_score",
+    "total_rules",
+    "matched_rules_count",
+    "missing_rules_count",
+]
+DateLike = Union[str, date, datetime, None]
+
+
+def risk_rank(level: Optional[str]) -> int:
+    """0 for unknown levels, then 1.. in RISK_LEVELS order."""
+    return RISK_LEVELS.index(level) + 1 if level in RISK_LEVELS else 0
+
+
+def max_risk_rank(report: Dict[str, Any]) -> int:
+    return max((risk_rank(level) for level in missing_risk_levels(report)), default=0)
+
+
+def report_summary(report: Dict[str, Any]) -> Dict[str, Any]:
+    summary = {field: report.get(field) for field in SUMMARY_FIELDS}
+    rank = max_risk_rank(report)
+    summary["max_risk_level"] = RISK_LEVELS[rank - 1] if rank else None
+    return summary
+
+
+def _iso_bound(value: DateLike, upper: bool) -> Optional[str]:
+    # A plain date (or YYYY-MM-DD string) as an upper bound covers that whole
+    # day. Raises ValueError for strings that are neither a date nor a datetime.
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        try:
+            value = date.fromisoformat(value)
+        except ValueError:
+            value = datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (value + timedelta(days=1) if upper else value).isoformat()
+
+
+class ReportQuery:
+    """Filters shared by the store implementations of `list_reports`."""
+
+    def __init__(
+        self,
+        analysis_type: Optional[str] = None,
+        date_from: DateLike = None,
+        date_to: DateLike = None,
+        filename: Optional[str] = None,
+        min_risk_level: Optional[str] = None,
+    ):
+        self.analysis_type = analysis_type
+        self.date_from = _iso_bound(date_from, upper=False)
+        self.date_to = _iso_bound(date_to, upper=True)
+        self.filename = filename.lower() if filename else None
+        if min_risk_level and min_risk_level not in RISK_LEVELS:
+            raise ValueError(f"Unknown risk level '{min_risk_level}' (expected one of {', '.join(RISK_LEVELS)})")
+        self.min_risk = risk_rank(min_risk_level) if min_risk_level else 0
+
+    def matches(self, report: Dict[str, Any]) -> bool:
+        analysis_date = report.get("analysis_date") or ""
+        return (
+            (self.analysis_type is None or report.get("analysis_type") == self.analysis_type)
+            and (self.date_from is None or analysis_date >= self.date_from)
+            and (self.date_to is None or analysis_date < self.date_to)
+            and (self.filename is None or self.filename in (report.get("filename") or "").lower())
+            and (not self.min_risk or max_risk_rank(report) >= self.min_risk)
+        )
+
+
+# --- Dashboard Aggregates ---
+# Running totals behind the dashboard, updated on every append so reading them
+# costs the same no matter how much history is stored.
+
+def empty_stats() -> Dict[str, Any]:
+    return {
+        "total_reports": 0,
+        "total_alerts": 0,
+        "compliance_score_sum": 0.0,
+        "analysis_type_counts": {},
+        "risk_level_counts": {},
+    }
+
+
+def accumulate_stats(stats: Dict[str, Any], reports: List[Dict[str, Any]], alerts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    stats["total_reports"] += len(reports)
+    stats["total_alerts"] += len(alerts)
+    type_counts = stats["analysis_type_counts"]
+    for report in reports:
+        stats["compliance_score_sum"] += report.get("compliance_score", 0)
+        analysis_type = report.get("analysis_type")
+        type_counts[analysis_type] = type_counts.get(analysis_type, 0) + 1
+    risk_counts = stats["risk_level_counts"]
+    for alert in alerts:
+        for level in missing_risk_levels(alert):
+            level = "Unknown" if level is None else level
+            risk_counts[level] = risk_counts.get(level, 0) + 1
+    return stats
+
+
+class ReportStore:
+    def append(self, reports: List[Dict[str, Any]], alerts: List[Dict[str, Any]]):
+        """Persist new reports and alerts."""
+        raise NotImplementedError
+
+    def get_report(self, report_id: str) -> Optional[Dict[str, Any]]:
+        """A full report, with its missing rules."""
+        raise NotImplementedError
+
+    def get_reports(self, report_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """The full reports with the given ids that exist, by id."""
+        raise NotImplementedError
+
+    def all_reports(self) -> List[Dict[str, Any]]:
+        """All reports as stored (missing rules by id, see `hydrate_record`), oldest first."""
+        raise NotImplementedError
+
+    def all_alerts(self) -> List[Dict[str, Any]]:
+        """All alerts as stored, oldest first."""
+        raise NotImplementedError
+
+    def rule_table(self) -> Dict[str, Dict[str, Any]]:
+        """Every rule a stored report refers to, by id."""
+        raise NotImplementedError
+
+    def compact(self):
+        """Intern the rules of records stored before the rule table existed and reclaim the space."""
+        raise NotImplementedError
+
+    def list_reports(self, query: ReportQuery, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """One page of report summaries, newest first.
+
+        Returns {"items": [...], "next_cursor": str or None}; pass
+        `next_cursor` back to get the following page.
+        """
+        raise NotImplementedError
+
+    def get_stats(self) -> Dict[str, Any]:
+        """The incrementally maintained dashboard aggregates (see `empty_stats`)."""
+        raise NotImplementedError
+
+    def rebuild_stats(self) -> Dict[str, Any]:
+        """Recompute the aggregates from the full history."""
+        raise NotImplementedError
+
+    def data_version(self) -> str:
+        """A cheap token that changes whenever reports or alerts are added."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonReportStore(ReportStore):
+    """The original JSON files, each with an append log, plus a stats file with the dashboard aggregates
+    and the rule table file.
+
+    The stats file records the size and mtime of the JSON files and logs it
+    was computed from, so edits made outside the store trigger a rebuild.
+    Writers (threads or processes) are serialized by a lock on the reports file.
+    Single reports and pages of the listing are read through an in-memory
+    index of the reports' offsets (see JsonRecordIndex).
+    """
+
+    def __init__(self, reports_file: str, alerts_file: str, stats_file: str, rules_file: str):
+        self.reports_file = reports_file
+        self.alerts_file = alerts_file
+        self.stats_file = stats_file
+        self.rules = RuleTable(rules_file)
+        self._index = JsonRecordIndex(reports_file, "report_id")
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _write(self):
+        with self._lock, file_lock(self.reports_file):
+            yield
+
+    def append(self, reports: List[Dict[str, Any]], alerts: List[Dict[str, Any]]):
+        new_rules: Dict[str, Dict[str, Any]] = {}
+        reports = [compact_record(report, new_rules) for report in reports]
+        alerts = [compact_alert(alert, new_rules) for alert in alerts]
+        with self._write():
+            stats = self._load_stats()
+            # Rules first: a stored report never refers to a rule that is not in the table.
+            self.rules.add(new_rules)
+            if reports:
+                append_json_records(self.reports_file, reports, "report_id")
+            if alerts:
+                append_json_records(self.alerts_file, alerts, "alert_id")
+            if stats is not None:
+                self._save_stats(accumulate_stats(stats, reports, alerts))
+
+    def compact(self):
+        """Fold both logs into their JSON arrays now, interning the rules of older records."""
+        with self._write():
+            stats = self._load_stats()
+            new_rules: Dict[str, Dict[str, Any]] = {}
+            reports = [compact_record(r, new_rules) for r in read_json_records(self.reports_file, "report_id")]
+            alerts = [compact_alert(a, new_rules) for a in read_json_records(self.alerts_file, "alert_id")]
+            self.rules.add(new_rules)
+            replace_json_records(self.reports_file, reports)
+            replace_json_records(self.alerts_file, alerts)
+            if stats is not None:
+                self._save_stats(stats)
+
+    def get_report(self, report_id: str) -> Optional[Dict[str, Any]]:
+        report = self._index.get([report_id]).get(report_id)
+        return hydrate_record(report, self.rules.load()) if report else None
+
+    def get_reports(self, report_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        rules = self.rules.load()
+        return {report_id: hydrate_record(r, rules) for report_id, r in self._index.get(report_ids).items()}
+
+    def all_reports(self) -> List[Dict[str, Any]]:
+        return read_json_records(self.reports_file, "report_id", share_findings)
+
+    def all_alerts(self) -> List[Dict[str, Any]]:
+        return read_json_records(self.alerts_file, "alert_id", share_findings)
+
+    def rule_table(self) -> Dict[str, Dict[str, Any]]:
+        return self.rules.load()
+
+    def list_reports(self, query: ReportQuery, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        # The cursor is the list position (1-based) of the last report returned.
+        found = self._index.newest(query.matches, limit + 1, before=int(cursor) - 1 if cursor else None)
+        items = [report_summary(report) for _, report in found[:limit]]
+        next_cursor = str(found[limit - 1][0] + 1) if len(found) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def _source_state(self) -> List[List[int]]:
+        state = []
+        files = (self.reports_file, self.alerts_file)
+        for path in files + tuple(log_path(path) for path in files):
+            try:
+                st = os.stat(path)
+                state.append([st.st_size, st.st_mtime_ns])
+            except OSError:
+                state.append([0, 0])
+        return state
+
+    def _load_stats(self) -> Optional[Dict[str, Any]]:
+        # None when the stats file is missing or out of date.
+        try:
+            with open(self.stats_file, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if stats.pop("sources", None) != self._source_state():
+            return None
+        return stats
+
+    def _save_stats(self, stats: Dict[str, Any]):
+        # Only called by writers, which hold the lock.
+        tmp_path = f"{self.stats_file}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(stats, sources=self._source_state()), f)
+        os.replace(tmp_path, self.stats_file)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self._load_stats()
+        return stats if stats is not None else self.rebuild_stats()
+
+    def data_version(self) -> str:
+        return "-".join(f"{size}:{mtime_ns}" for size, mtime_ns in self._source_state())
+
+    def rebuild_stats(self) -> Dict[str, Any]:
+        with self._write():
+            stats = accumulate_stats(empty_stats(), self.all_reports(), self.all_alerts())
+            self._save_stats(stats)
+            return stats
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    report_id TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    analysis_date TEXT,
+    analysis_type TEXT,
+    compliance_score REAL,
+    total_rules INTEGER,
+    matched_rules_count INTEGER,
+    missing_rules_count INTEGER,
+    max_risk INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_reports_analysis_date ON reports (analysis_date);
+CREATE INDEX IF NOT EXISTS idx_reports_analysis_type ON reports (analysis_type);
+CREATE INDEX IF NOT EXISTS idx_reports_filename ON reports (filename);
+CREATE INDEX IF NOT EXISTS idx_reports_max_risk ON reports (max_risk);
+CREATE TABLE IF NOT EXISTS alerts (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    alert_id TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    alert_date TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_alert_date ON alerts (alert_date);
+CREATE TABLE IF NOT EXISTS rules (
+    rule_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+# Stays below SQLite's default limit on bound parameters per statement.
+_SQL_BATCH = 500
+
+
+class SQLiteReportStore(ReportStore):
+    """Reports and alerts in SQLite (WAL mode), one connection per thread."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        if self.get_meta("dashboard_stats") is None:
+            self.rebuild_stats()
+        if self.get_meta("rules_interned") is None:
+            self.compact()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode; writes use explicit BEGIN IMMEDIATE transactions.
+            # Each connection is only used by its own thread, but close() may
+            # run on another one.
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def _write(self):
+        # Take the write lock up front so read-modify-write of the aggregates
+        # cannot interleave with another writer.
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def append(self, reports: List[Dict[str, Any]], alerts: List[Dict[str, Any]]):
+        with self._write() as conn:
+            self._insert(conn, reports, alerts, "INSERT")
+            stats = accumulate_stats(self._stats(conn), reports, alerts)
+            self._set_meta(conn, "dashboard_stats", json.dumps(stats))
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, reports, alerts, verb: str) -> List[int]:
+        # Returns the number of reports and of alerts inserted.
+        new_rules: Dict[str, Dict[str, Any]] = {}
+        reports = [compact_record(report, new_rules) for report in reports]
+        alerts = [compact_alert(alert, new_rules) for alert in alerts]
+        conn.executemany(
+            "INSERT OR IGNORE INTO rules (rule_id, data) VALUES (?, ?)",
+            [(rid, json.dumps(rule)) for rid, rule in new_rules.items()],
+        )
+        report_count = conn.executemany(
+            f"{verb} INTO reports (report_id, filename, analysis_date, analysis_type, compliance_score,"
+            " total_rules, matched_rules_count, missing_rules_count, max_risk, data)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    r["report_id"],
+                    r.get("filename"),
+                    r.get("analysis_date"),
+                    r.get("analysis_type"),
+                    r.get("compliance_score"),
+                    r.get("total_rules"),
+                    r.get("matched_rules_count"),
+                    r.get("missing_rules_count"),
+                    max_risk_rank(r),
+                    json.dumps(r),
+                )
+                for r in reports
+            ],
+        ).rowcount
+        alert_count = conn.executemany(
+            f"{verb} INTO alerts (alert_id, filename, alert_date, data) VALUES (?, ?, ?, ?)",
+            [(a["alert_id"], a.get("filename"), a.get("alert_date"), json.dumps(a)) for a in alerts],
+        ).rowcount
+        return [report_count, alert_count]
+
+    def _rules(self, rule_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        rule_ids = list(rule_ids)
+        rules = {}
+        for start in range(0, len(rule_ids), _SQL_BATCH):
+            batch = rule_ids[start:start + _SQL_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            for rid, data in self._conn().execute(
+                f"SELECT rule_id, data FROM rules WHERE rule_id IN ({placeholders})", batch
+            ):
+                rules[rid] = json.loads(data)
+        return rules
+
+    def get_report(self, report_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM reports WHERE report_id = ?", (report_id,)).fetchone()
+        if not row:
+            return None
+        report = json.loads(row[0])
+        return hydrate_record(report, self._rules(referenced_rule_ids([report])))
+
+    def get_reports(self, report_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        report_ids = list(report_ids)
+        reports = {}
+        for start in range(0, len(report_ids), _SQL_BATCH):
+            batch = report_ids[start:start + _SQL_BATCH]
+            placeholders = ", ".join("?" * len(batch))
+            for report_id, data in self._conn().execute(
+                f"SELECT report_id, data FROM reports WHERE report_id IN ({placeholders})", batch
+            ):
+                reports[report_id] = json.loads(data)
+        rules = self._rules(referenced_rule_ids(reports.values()))
+        return {report_id: hydrate_record(report, rules) for report_id, report in reports.items()}
+
+    def all_reports(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT data FROM reports ORDER BY seq")
+        return [json.loads(data, object_hook=share_findings) for (data,) in rows]
+
+    def all_alerts(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT data FROM alerts ORDER BY seq")
+        return [json.loads(data, object_hook=share_findings) for (data,) in rows]
+
+    def rule_table(self) -> Dict[str, Dict[str, Any]]:
+        return {rid: json.loads(data) for rid, data in self._conn().execute("SELECT rule_id, data FROM rules")}
+
+    def list_reports(self, query: ReportQuery, limit: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        # The cursor is the seq of the last report returned.
+        clauses, params = [], []
+        if cursor:
+            clauses.append("seq < ?")
+            params.append(int(cursor))
+        if query.analysis_type is not None:
+            clauses.append("analysis_type = ?")
+            params.append(query.analysis_type)
+        if query.date_from is not None:
+            clauses.append("analysis_date >= ?")
+            params.append(query.date_from)
+        if query.date_to is not None:
+            clauses.append("analysis_date < ?")
+            params.append(query.date_to)
+        if query.filename is not None:
+            clauses.append("instr(lower(filename), ?) > 0")
+            params.append(query.filename)
+        if query.min_risk:
+            clauses.append("max_risk >= ?")
+            params.append(query.min_risk)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._conn().execute(
+            f"SELECT seq, {', '.join(SUMMARY_FIELDS)}, max_risk FROM reports {where} ORDER BY seq DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        items = []
+        for row in rows[:limit]:
+            item = dict(zip(SUMMARY_FIELDS, row[1:-1]))
+            item["max_risk_level"] = RISK_LEVELS[row[-1] - 1] if row[-1] else None
+            items.append(item)
+        next_cursor = str(rows[limit - 1][0]) if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._write() as conn:
+            self._set_meta(conn, key, value)
+
+    @staticmethod
+    def _set_meta(conn: sqlite3.Connection, key: str, value: str):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def _stats(self, conn: sqlite3.Connection) -> Dict[str, Any]:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'dashboard_stats'").fetchone()
+        return json.loads(row[0]) if row else empty_stats()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return self._stats(self._conn())
+
+    def data_version(self) -> str:
+        # Rows are only ever appended, so the newest sequence numbers identify the contents.
+        row = self._conn().execute(
+            "SELECT (SELECT COALESCE(MAX(seq), 0) FROM reports), (SELECT COALESCE(MAX(seq), 0) FROM alerts)"
+        ).fetchone()
+        return f"{row[0]}:{row[1]}"
+
+    def rebuild_stats(self) -> Dict[str, Any]:
+        with self._write() as conn:
+            stats = empty_stats()
+            for (data,) in conn.execute("SELECT data FROM reports ORDER BY seq"):
+                accumulate_stats(stats, [json.loads(data)], [])
+            for (data,) in conn.execute("SELECT data FROM alerts ORDER BY seq"):
+                accumulate_stats(stats, [], [json.loads(data)])
+            self._set_meta(conn, "dashboard_stats", json.dumps(stats))
+            return stats
+
+    def migrate_from_json(self, reports_file: str, alerts_file: str) -> Dict[str, int]:
+        """Import existing JSON history once; records already present are skipped."""
+        if self.get_meta("json_migrated"):
+            return {"reports": 0, "alerts": 0}
+        reports = read_json_records(reports_file, "report_id")
+        alerts = read_json_records(alerts_file, "alert_id")
+        with self._write() as conn:
+            report_count, alert_count = self._insert(conn, reports, alerts, "INSERT OR IGNORE")
+            self._set_meta(conn, "json_migrated", "1")
+        self.rebuild_stats()
+        return {"reports": report_count, "alerts": alert_count}
+
+    def compact(self):
+        rewritten = 0
+        with self._write() as conn:
+            new_rules: Dict[str, Dict[str, Any]] = {}
+            for table, compact in (("reports", compact_record), ("alerts", compact_alert)):
+                updates = []
+                for seq, data in conn.execute(f"SELECT seq, data FROM {table}"):
+                    record = json.loads(data)
+                    if "missing_rules" in record:
+                        updates.append((json.dumps(compact(record, new_rules)), seq))
+                conn.executemany(f"UPDATE {table} SET data = ? WHERE seq = ?", updates)
+                rewritten += len(updates)
+            conn.executemany(
+                "INSERT OR IGNORE INTO rules (rule_id, data) VALUES (?, ?)",
+                [(rid, json.dumps(rule)) for rid, rule in new_rules.items()],
+            )
+            self._set_meta(conn, "rules_interned", "1")
+        if rewritten:
+            # Give the space of the old rows back to the file system.
+            self._conn().execute("VACUUM")
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+
+# --- Form Manifest ---
+
+class FormManifest:
+    """What every analyzed form looked like when it was last analyzed, per analysis type.
+
+    Maps an analysis type, then a form's path, to the form's size, mtime,
+    content hash, the regulation-set version it was checked against and the
+    id of the resulting report; a manual and an auto run over the same form
+    each keep their own entry. The file is re-read under a lock (shared with
+    other processes) before every update and replaced atomically, so
+    concurrent runs never lose each other's entries.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load_all(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self, analysis_type: str) -> Dict[str, Dict[str, Any]]:
+        return self._load_all().get(analysis_type, {})
+
+    def update(
+        self,
+        analysis_type: str,
+        entries: Dict[str, Dict[str, Any]],
+        keep: Optional[Iterable[str]] = None,
+        directory: Optional[str] = None,
+    ):
+        """Merge `entries` in; with `keep`, drop the type's entries for any other path (in `directory`, if given)."""
+        with self._lock, file_lock(self.path):
+            manifest = self._load_all()
+            typed = manifest.setdefault(analysis_type, {})
+            typed.update(entries)
+            if keep is not None:
+                keep = set(keep)
+                manifest[analysis_type] = {
+                    path: entry
+                    for path, entry in typed.items()
+                    if path in keep or (directory is not None and os.path.dirname(path) != directory)
+                }
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(manifest, f)
+            os.replace(tmp_path, self.path)
+
+
+def create_store(
+    backend: str, reports_file: str, alerts_file: str, stats_file: str, db_path: str, rules_file: str
+) -> ReportStore:
+    if backend == "json":
+        store = JsonReportStore(reports_file, alerts_file, stats_file, rules_file)
+        if not store.rules.exists():
+            # History from before the rule table: intern its rules once.
+            store.compact()
+        return store
+    if backend == "sqlite":
+        store = SQLiteReportStore(db_path)
+        store.migrate_from_json(reports_file, alerts_file)
+        return store
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate reports.json/alerts.json into a SQLite store.")
+    parser.add_argument("--reports", default=os.path.join("data", "reports.json"))
+    parser.add_argument("--alerts", default=os.path.join("data", "alerts.json"))
+    parser.add_argument("--db", default=os.path.join("data", "compliance.db"))
+    parser.add_argument("--rules", default=os.path.join("data", "rules.json"))
+    parser.add_argument("--stats", default=os.path.join("data", "stats.json"))
+    parser.add_argument(
+        "--compact", action="store_true", help="compact the JSON files in place (intern rules, fold logs) instead"
+    )
+    args = parser.parse_args()
+    if args.compact:
+        before = sum(os.path.getsize(p) for p in (args.reports, args.alerts) if os.path.exists(p))
+        JsonReportStore(args.reports, args.alerts, args.stats, args.rules).compact()
+        after = sum(os.path.getsize(p) for p in (args.reports, args.alerts, args.rules))
+        print(f"Compacted {args.reports} and {args.alerts}: {before} -> {after} bytes (rule table included)")
+    else:
+        counts = SQLiteReportStore(args.db).migrate_from_json(args.reports, args.alerts)
+        print(f"Imported {counts['reports']} reports and {counts['alerts']} alerts into {args.db}")